@@ -0,0 +1,140 @@
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+from time import perf_counter
+
+from numpy import arange, exp, float32, pi, random, sin, sqrt
+from obspy import Stream, Trace
+from obspy import UTCDateTime as utc
+from yaml import SafeLoader, load
+
+from core.Extra import readConfiguration
+
+GRID_KEYS = ["batch_size", "overlap", "picker_parallelism"]
+
+
+def readBenchmarkConfig():
+    benchmarkConfigPath = os.path.join("files", "benchmark.yml")
+    if not os.path.exists(benchmarkConfigPath):
+        msg = "+++ Could not find benchmark configuration file! Aborting ..."
+        print(msg)
+        sys.exit()
+    with open(benchmarkConfigPath) as f:
+        config = load(f, Loader=SafeLoader)
+    return config
+
+
+def syntheticStream(bench):
+    """Generate continuous three-component data for a synthetic network
+
+    Stations are spread over a 100 km square, events get a P and an S
+    wavelet at each station and a fraction of every trace is cut out as
+    gaps.
+
+    Args:
+        bench (dict): benchmark configuration
+
+    Returns:
+        obspy.Stream: synthetic stream
+    """
+    rng = random.default_rng(bench["seed"])
+    sr = bench["sampling_rate"]
+    npts = int(bench["duration"] * sr)
+    t0 = utc("2020-01-01")
+    stations = rng.uniform(0, 100, (bench["stations"], 2))
+    events = rng.uniform(0, 100, (bench["events"], 2))
+    origins = rng.uniform(0, bench["duration"] - 60, bench["events"])
+    wavelet = arange(int(4 * sr)) / sr
+    wavelet = sin(2 * pi * 5 * wavelet) * exp(-2 * wavelet)
+    stream = Stream()
+    for s, (sx, sy) in enumerate(stations):
+        for component in "ENZ":
+            data = rng.normal(0, 1, npts).astype(float32)
+            for (ex, ey), origin in zip(events, origins):
+                dist = sqrt((sx - ex) ** 2 + (sy - ey) ** 2 + 10 ** 2)
+                for velocity, amp in [(6.0, 10), (6.0 / 1.75, 20)]:
+                    i = int((origin + dist / velocity) * sr)
+                    n = min(len(wavelet), npts - i)
+                    if n > 0:
+                        data[i:i + n] += amp * wavelet[:n]
+            tr = Trace(data=data, header={
+                "network": "SY",
+                "station": f"S{s:03d}",
+                "channel": f"HH{component}",
+                "starttime": t0,
+                "sampling_rate": sr})
+            nGaps = int(bench["gap_fraction"] * bench["duration"] / 60)
+            for g in sorted(rng.uniform(0, bench["duration"] - 60, nGaps))[::-1]:
+                first = tr.slice(endtime=t0 + g)
+                second = tr.slice(starttime=t0 + g + 60)
+                if second.stats.npts:
+                    stream += second
+                tr = first
+            stream += tr
+    return stream
+
+
+def runBenchmarkPoint(config, bench, queue):
+    """Run the picker once on synthetic data, in a fresh process"""
+    from core.Picker import getPicker, pickStream, timings
+
+    stream = syntheticStream(bench)
+    nSamples = sum([tr.stats.npts for tr in stream])
+    picker = getPicker(config)
+    tic = perf_counter()
+    picks = pickStream(picker, stream, config)
+    elapsed = perf_counter() - tic
+    queue.put({
+        "samples": nSamples,
+        "picks": len(picks),
+        "load_s": timings["load"],
+        "inference_s": elapsed,
+        "samples_per_s": nSamples / elapsed,
+        "picks_per_s": len(picks) / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def runBenchmark():
+    config = readConfiguration()
+    bench = readBenchmarkConfig()
+    Path(os.path.dirname(bench["results_file"])).mkdir(parents=True, exist_ok=True)
+    ctx = mp.get_context("spawn")
+    grid = list(product(*[bench[key] for key in GRID_KEYS]))
+    for values in grid:
+        params = dict(zip(GRID_KEYS, values))
+        print(f"+++ Benchmarking {config['picker']} with {params} ...")
+        runConfig = {**config, **params}
+        queue = ctx.Queue()
+        process = ctx.Process(
+            target=runBenchmarkPoint, args=(runConfig, bench, queue))
+        process.start()
+        process.join()
+        if queue.empty():
+            print(f"+++ Benchmark failed for {params}, skipping.")
+            continue
+        result = queue.get()
+        record = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "picker": config["picker"],
+            "model": config["model"],
+            "inference_backend": config["inference_backend"],
+            **{key: bench[key] for key in [
+                "stations", "sampling_rate", "duration", "gap_fraction", "events"]},
+            **params,
+            **result,
+        }
+        print(f"+++ {record['samples_per_s']:.3g} samples/s, "
+              f"{record['picks_per_s']:.3g} picks/s, "
+              f"peak RSS {record['peak_rss_mb']:.0f} MB")
+        with open(bench["results_file"], "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    runBenchmark()
@@ -0,0 +1,79 @@
+from numpy import (abs, array, char, column_stack, concatenate, float32,
+                   fmax, full, nan, nan_to_num, where)
+
+# Wood-Anderson response for velocity input, output in m
+WOOD_ANDERSON = {
+    "poles": [-6.283 + 4.7124j, -6.283 - 4.7124j],
+    "zeros": [0j],
+    "gain": 1.0,
+    "sensitivity": 2080}
+
+
+def calibrate(tr, config, inventory):
+    """Get trace data in physical units
+
+    Velocity in m/s, or Wood-Anderson displacement in m if
+    amplitude_wood_anderson is set. Counts if no inventory is given.
+    """
+    if inventory is None:
+        return tr.data
+    if config["amplitude_wood_anderson"]:
+        tr = tr.copy()
+        tr.detrend("demean")
+        tr.remove_response(inventory, output="VEL")
+        tr.simulate(paz_simulate=WOOD_ANDERSON)
+        return tr.data
+    response = inventory.get_response(tr.id, tr.stats.starttime)
+    return tr.data / response.instrument_sensitivity.value
+
+
+def measureAmplitudes(stream, picks, config, inventory=None):
+    """Measure the peak absolute amplitude around each pick
+
+    The window is amplitude_window seconds before and after the pick
+    time, the largest value over the horizontal components (all components
+    if a station has no horizontals) is kept. Each trace is scanned once
+    for all of its picks.
+
+    Args:
+        stream (obspy.Stream): waveforms the picks were made on
+        picks (numpy.ndarray): pick records of core.PickStore
+        config (dict): a dictionary contains main configuration
+        inventory (obspy.Inventory, optional): responses. Defaults to None.
+
+    Returns:
+        numpy.ndarray: amplitude per pick, NaN where nothing was measured
+    """
+    amplitudes = full(len(picks), nan, dtype=float32)
+    if not len(picks):
+        return amplitudes
+    pre, post = config["amplitude_window"]
+    keys = array([".".join(trace_id.split(".")[:2])
+                  for trace_id in char.decode(picks["trace_id"])])
+    for tr in stream:
+        station = tr.stats.station
+        if tr.stats.channel[-1] == "Z" and \
+                len(stream.select(station=station)) > \
+                len(stream.select(station=station, channel="??Z")):
+            continue
+        sel = where(keys == f"{tr.stats.network}.{station}")[0]
+        if not len(sel) or not tr.stats.npts:
+            continue
+        try:
+            data = calibrate(tr, config, inventory)
+        except Exception:
+            continue
+        sr = tr.stats.sampling_rate
+        t0 = tr.stats.starttime.timestamp
+        i0 = ((picks["peak_time"][sel] - pre - t0) * sr).astype(int)
+        i1 = ((picks["peak_time"][sel] + post - t0) * sr).astype(int)
+        i0, i1 = i0.clip(0, tr.stats.npts), i1.clip(0, tr.stats.npts)
+        ok = i1 > i0
+        if not ok.any():
+            continue
+        # A trailing zero keeps end indices equal to npts valid
+        absData = concatenate([abs(nan_to_num(data)), [0]])
+        peaks = fmax.reduceat(
+            absData, column_stack([i0[ok], i1[ok]]).ravel())[::2]
+        amplitudes[sel[ok]] = fmax(amplitudes[sel[ok]], peaks)
+    return amplitudes
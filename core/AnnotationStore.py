@@ -0,0 +1,68 @@
+import os
+from glob import glob
+
+from numpy import float16, float32
+from obspy import Stream, Trace
+from seisbench.models import WaveformModel
+from seisbench.util import PickList
+
+from core.GridStore import readGrid, writeGrid
+
+
+def annotationPath(st, et):
+    return os.path.join(
+        "results", "annotations",
+        f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}")
+
+
+def saveAnnotations(annotations, st, et):
+    """Store annotation traces as float16 arrays per station-day
+
+    See core.GridStore.writeGrid for the layout.
+
+    Args:
+        annotations (obspy.Stream): output of the picker annotate function
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+    """
+    writeGrid(annotations, annotationPath(st, et), float16)
+
+
+def loadAnnotations(st, et, phases=("P", "S")):
+    """Load stored annotations of a day as memory-mapped traces
+
+    Args:
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+        phases (tuple, optional): phases to load. Defaults to ("P", "S").
+
+    Returns:
+        obspy.Stream: annotation traces, one per channel and data segment
+    """
+    annotations = Stream()
+    for headerFile in sorted(glob(os.path.join(annotationPath(st, et), "*.json"))):
+        annotations += readGrid(
+            headerFile, keep=lambda channel: channel.split("_")[-1] in phases)
+    return annotations
+
+
+def picksFromAnnotations(annotations, config):
+    """Extract picks from annotation traces without calling the model
+
+    Uses the same trigger on/off peak detection as SeisBench classify.
+
+    Args:
+        annotations (obspy.Stream): annotation traces
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        seisbench.util.PickList: picks sorted by time
+    """
+    picks = PickList()
+    for phase in ["P", "S"]:
+        sub = Stream([
+            Trace(data=tr.data.astype(float32), header=tr.stats)
+            for tr in annotations if tr.stats.channel.endswith(f"_{phase}")])
+        picks += WaveformModel.picks_from_annotations(
+            sub, config[f"min_{phase}_probability"], phase)
+    return PickList(sorted(picks))
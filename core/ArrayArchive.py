@@ -0,0 +1,113 @@
+import json
+import os
+from fnmatch import fnmatch
+from glob import glob
+
+from numpy import float32
+from obspy import Stream, read
+from obspy import UTCDateTime as utc
+from tqdm import tqdm
+
+from core.GridStore import readGrid, writeGrid
+
+
+def archivePath(st, et):
+    return os.path.join(
+        "DB", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}", "arrays")
+
+
+def rawFiles(station, st, et):
+    return sorted(glob(os.path.join(
+        "DB",
+        f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}",
+        "waveforms",
+        f"??.{station}.*.???__{st.strftime('%Y%m%d')}T000000Z__{et.strftime('%Y%m%d')}T000000Z.mseed")))
+
+
+def sourceStamp(files):
+    return {f: [os.path.getsize(f), os.path.getmtime(f)] for f in files}
+
+
+def writeArchive(stream, path, sources):
+    """Write a stream as float32 arrays, see core.GridStore.writeGrid
+
+    Args:
+        stream (obspy.Stream): station-day waveforms
+        path (str): archive directory of the day
+        sources (dict): size and mtime of the miniSEED files converted
+    """
+    writeGrid(stream, path, float32, {"sources": sources})
+
+
+def isArchived(station, st, et):
+    """Check that the archive of a station is newer than its miniSEED"""
+    headers = glob(os.path.join(archivePath(st, et), f"*.{station}.*.json"))
+    if not headers:
+        return False
+    sources = json.loads(json.dumps(sourceStamp(rawFiles(station, st, et))))
+    for headerFile in headers:
+        with open(headerFile) as f:
+            if json.load(f)["sources"] != sources:
+                return False
+    return True
+
+
+def archiveStation(station, st, et):
+    """Convert the miniSEED of one station-day into the array archive"""
+    files = rawFiles(station, st, et)
+    for headerFile in glob(os.path.join(archivePath(st, et), f"*.{station}.*.json")):
+        os.remove(headerFile)
+        os.remove(headerFile[:-5] + ".npy")
+    if not files:
+        return
+    stream = Stream()
+    for f in files:
+        stream += read(f, format="MSEED", check_compression=False)
+    stream.merge(method=-1)
+    writeArchive(stream, archivePath(st, et), sourceStamp(files))
+
+
+def readArchive(station, st, et, starttime=None, endtime=None, channel="*"):
+    """Read a station-day from the array archive without copying
+
+    Args:
+        station (str): station code
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+        starttime (UTCDateTime, optional): window start. Defaults to None.
+        endtime (UTCDateTime, optional): window end. Defaults to None.
+        channel (str, optional): channel pattern. Defaults to "*".
+
+    Returns:
+        obspy.Stream: one trace per channel and data segment, each a view
+        into the memory-mapped array
+    """
+    stream = Stream()
+    for headerFile in sorted(glob(os.path.join(
+            archivePath(st, et), f"*.{station}.*.json"))):
+        stream += readGrid(headerFile, starttime, endtime,
+                           lambda cha: fnmatch(cha, channel))
+    return stream
+
+
+def archiveStations(config, st, et, stations):
+    """Convert stations missing from the archive and open them all
+
+    Returns:
+        list: memory-mapped streams of the stations within the day and
+        searchWindow, sorted by station
+    """
+    todo = [s for s in stations if not isArchived(s, st, et)]
+    for station in tqdm(todo, desc="+++ Converting to array archive",
+                        unit="station"):
+        archiveStation(station, st, et)
+    t1, t2 = utc(st), utc(et)
+    if len(config["searchWindow"]):
+        s, t = config["searchWindow"]
+        t1, t2 = max(t1, utc(s)), min(t2, utc(t))
+    streams = []
+    for station in sorted(stations):
+        stream = readArchive(station, st, et, t1, t2)
+        if len(stream):
+            streams.append(stream)
+    return streams
@@ -1,16 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from gamma.utils import association
-from pandas import DataFrame, Series, date_range
+from obspy import UTCDateTime as utc
+from pandas import DataFrame, concat, date_range, to_datetime
+from pandas.util import hash_pandas_object
 from tqdm import tqdm
+import json
 import os
 import pyocto
-from obspy import read_inventory
-from core.PrepareData import prepareInventory, loadModel
-from numpy import array, nan
+from core.PickStore import loadPicks, picksToFrame
+from core.PrepareData import loadStationTable, prepareInventory
+from core.Projection import getProjection, projectColumns
+from core.Tables import readTable, toSeconds, typedTable, writeTable
+from core.TravelTimes import cachedEikonal, eikonalCache, pyoctoVelocityModel
+from numpy import array, column_stack, concatenate, inf, isin, load, nan, save
+from sklearn.cluster import DBSCAN
+from time import perf_counter
 from pathlib import Path
 from datetime import timedelta as td
-from pyproj import Proj
 from gamma.utils import estimate_eps
-from obspy.geodetics.base import degrees2kilometers as d2k
 
 
 def applyGaMMaConfig(config, stations):
@@ -18,7 +25,7 @@ def applyGaMMaConfig(config, stations):
         "BGMM": 5,
         "GMM": 1}
     config["oversample_factor"] = method[config["method"]]
-    config["ncpu"] = os.cpu_count() - 2
+    config["ncpu"] = config["number_cpu"] or os.cpu_count() - 2
     config["degree2km"] = 111.19492474777779
     config["h"] = 3.0
     config["vel"] = {"p": 6.0, "s": 6.0 / 1.75}
@@ -54,20 +61,154 @@ def applyGaMMaConfig(config, stations):
     return config
 
 
-def assocciateWithGamma(config, st, et, proj):
-    picks = loadModel(os.path.join(
-        "results", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.jlib"))
-    pick_df = []
-    for pick in picks:
-        pick_df.append(
-            {"id": pick.trace_id,
-             "timestamp": pick.peak_time.datetime,
-             "prob": pick.peak_value,
-             "type": pick.phase.lower(),
-             "amp": nan,  # pick.phase_amplitude,
-             "phase_amp": nan  # pick.phase_amplitude
-             })
-    pick_df = DataFrame(pick_df)
+def prepareTravelTimes(config):
+    """Build the travel-time tables once, before day workers load them"""
+    if config["associator"] == "PyOcto":
+        pyoctoVelocityModel(config)
+    elif config["useEikonal"]:
+        # Stations are only needed to estimate dbscan_eps
+        gammaConfig = applyGaMMaConfig({**config, "dbscan_eps": 0}, None)
+        cachedEikonal(gammaConfig["eikonal"])
+
+
+def dayPicks(config, st, et):
+    """Load the picks of a day and association_overlap s of its neighbours
+
+    With an overlap, picks of the day itself are limited to the day too,
+    so picks kept in two day files are not used twice.
+
+    Returns:
+        DataFrame: picks as built by core.PickStore.picksToFrame
+    """
+    margin = config["association_overlap"]
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    if not margin:
+        return picksToFrame(loadPicks(day))
+    t1, t2 = utc(st), utc(et)
+    prevDay = f"{(st-td(days=1)).strftime('%Y%m%d')}_{st.strftime('%Y%m%d')}"
+    nextDay = f"{et.strftime('%Y%m%d')}_{(et+td(days=1)).strftime('%Y%m%d')}"
+    return picksToFrame(concatenate([
+        loadPicks(prevDay, t1 - margin, t1),
+        loadPicks(day, t1, t2),
+        loadPicks(nextDay, t2, t2 + margin)]))
+
+
+def ownedEvents(times, st, et, config):
+    """Mask of events the day owns: those with origin time inside it
+
+    Events found again by a neighbour day from the overlap picks fall
+    outside that day and are dropped there, so each is kept exactly once.
+    """
+    if not config["association_overlap"]:
+        return times == times
+    return (times >= st) & (times < et)
+
+
+def partitionPicks(pick_df, station_dict, config):
+    """Split picks into independent space-time clusters
+
+    Picks are linked by DBSCAN on pick time (s) and station x/y divided
+    by the P velocity, with dbscan_eps as the link distance and no noise
+    label, so picks closer than dbscan_eps always end up together. Picks
+    of stations missing from the inventory are left out, as GaMMA drops
+    them as well. The linking chains busy days into few large clusters,
+    these are split further when gamma_partition_max_picks is set.
+
+    Returns:
+        list: pick_df index arrays, one per cluster, in time order
+    """
+    located = pick_df[pick_df["id"].isin(station_dict)]
+    if len(located) == 0:
+        return []
+    t = (located["timestamp"] - located["timestamp"].min()).dt.total_seconds()
+    xy = array([station_dict[i] for i in located["id"]])
+    features = column_stack([t.values, xy / config["vel"]["p"]])
+    labels = DBSCAN(eps=config["dbscan_eps"], min_samples=1).fit(features).labels_
+    clusters = [located.index[labels == label] for label in set(labels)]
+    largest = max([len(c) for c in clusters])
+    print(f"+++ Largest pick cluster holds {largest}/{len(located)} picks")
+    maxPicks = config["gamma_partition_max_picks"]
+    if maxPicks and largest > maxPicks:
+        clusters = [part for c in clusters for part in
+                    splitCluster(c, located["timestamp"], maxPicks)]
+        print(f"+++ Split clusters over {maxPicks} picks at their widest "
+              f"time gaps into {len(clusters)} clusters")
+    return sorted(clusters, key=lambda c: located.loc[c, "timestamp"].min())
+
+
+def splitCluster(cluster, times, maxPicks):
+    """Split a cluster at its widest pick-time gaps until within maxPicks
+
+    The cut is taken in the middle half of the picks, so both parts
+    shrink. Events spanning a cut may lose picks on one side.
+
+    Returns:
+        list: pick_df index arrays
+    """
+    if len(cluster) <= maxPicks:
+        return [cluster]
+    t = times.loc[cluster].sort_values()
+    n = len(t)
+    gaps = t.diff().dt.total_seconds().values[n//4 + 1:3*n//4 + 1]
+    cut = n//4 + 1 + gaps.argmax()
+    return splitCluster(t.index[:cut], times, maxPicks) + \
+        splitCluster(t.index[cut:], times, maxPicks)
+
+
+def associateCluster(picks, station_df, config):
+    tic = perf_counter()
+    with eikonalCache():
+        catalogs, assignments = association(
+            picks, station_df, {**config, "ncpu": 1}, 0, config["method"])
+    return catalogs, assignments, perf_counter() - tic
+
+
+def associatePartitions(pick_df, station_df, station_dict, config):
+    """Run GaMMA on independent pick clusters in a process pool
+
+    Clusters are submitted largest first and merged in time order, event
+    indices are renumbered globally so the result does not depend on
+    which worker finished first.
+
+    Returns:
+        tuple: catalogs and assignments in the format of GaMMA association
+    """
+    clusters = partitionPicks(pick_df, station_dict, config)
+    clusters = [c for c in clusters if len(c) >= config["min_picks_per_eq"]]
+    if config["useEikonal"]:
+        # Solve the table once before the workers load it
+        cachedEikonal(config["eikonal"])
+    print(f"+++ Associating {len(pick_df)} picks in {len(clusters)} "
+          f"clusters with {config['ncpu']} workers")
+    catalogs, assignments, timings = [], [], []
+    with ProcessPoolExecutor(max_workers=config["ncpu"]) as pool:
+        futures = {}
+        for c in sorted(range(len(clusters)), key=lambda c: -len(clusters[c])):
+            futures[c] = pool.submit(
+                associateCluster, pick_df.loc[clusters[c]], station_df, config)
+        for c in tqdm(range(len(clusters)), desc="+++ Merging clusters"):
+            events, assigned, elapsed = futures[c].result()
+            eventMap = {}
+            for event in events:
+                eventMap[event["event_index"]] = len(catalogs)
+                catalogs.append({**event, "event_index": len(catalogs)})
+            assignments += [(pick, eventMap[event], score)
+                            for pick, event, score in assigned]
+            timings.append((elapsed, len(clusters[c]), len(events), c))
+    for elapsed, nPicks, nEvents, c in sorted(timings, reverse=True)[:5]:
+        print(f"+++ Cluster {c}: {nPicks} picks, {nEvents} events, "
+              f"{elapsed:.1f} s")
+    return catalogs, assignments
+
+
+def assocciateWithGamma(config, st, et, proj, picks):
+    pick_df = DataFrame({
+        "id": picks["trace_id"],
+        "timestamp": picks["time"],
+        "prob": picks["peak_value"],
+        "type": picks["phase"].str.lower(),
+        "amp": picks["amplitude"],
+        "phase_amp": picks["amplitude"]})
     station_df, station_dict = prepareInventory(config, proj, st, et)
 
     # Apply GaMMa configuration
@@ -75,28 +216,30 @@ def assocciateWithGamma(config, st, et, proj):
 
     # Removes picks without amplitude if amplitude flag is set to True
     if config["use_amplitude"]:
-        pick_df = pick_df[pick_df["phase_amplitude"] != -1]
+        pick_df = pick_df[pick_df["amp"] > 0].reset_index(drop=True)
 
     # Rum GaMMa associator
     event_index0 = 0
     assignments = []
-    pbar = tqdm(1)
-    catalogs, assignments = association(
-        pick_df,
-        station_df,
-        config,
-        event_index0,
-        config["method"],
-        pbar=pbar)
+    if config["gamma_partition"]:
+        catalogs, assignments = associatePartitions(
+            pick_df, station_df, station_dict, config)
+    else:
+        pbar = tqdm(1)
+        with eikonalCache():
+            catalogs, assignments = association(
+                pick_df,
+                station_df,
+                config,
+                event_index0,
+                config["method"],
+                pbar=pbar)
     event_index0 += len(catalogs)
 
     if event_index0 == 0:
-        return False
+        return None
 
     # Create catalog
-    catalog_csv = os.path.join(
-        "results",
-        f"catalog_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
     catalogs = DataFrame(
         catalogs,
         columns=["time"]+config["dims"]+[
@@ -106,34 +249,30 @@ def assocciateWithGamma(config, st, et, proj):
             "cov_time_amp",
             "event_index",
             "gamma_score"])
-    catalogs[[
-        "longitude",
-        "latitude"]] = catalogs.apply(lambda x: Series(
-            proj(longitude=x["x(km)"],
-                 latitude=x["y(km)"],
-                 inverse=True)),
-        axis=1)
+    catalogs = catalogs[ownedEvents(
+        to_datetime(catalogs["time"]), st, et, config)]
+    if len(catalogs) == 0:
+        return None
+    eventMap = dict(zip(catalogs["event_index"], range(len(catalogs))))
+    catalogs = catalogs.reset_index(drop=True)
+    catalogs["event_index"] = range(len(catalogs))
+    catalogs = projectColumns(
+        proj, catalogs,
+        ["x(km)", "y(km)"], ["longitude", "latitude"], inverse=True)
     catalogs["depth"] = catalogs["z(km)"]
     catalogs.replace({"magnitude": 999}, 99, inplace=True)
     catalogs["magnitude"] = nan
-    with open(catalog_csv, "w") as fp:
-        catalogs.to_csv(
-            fp,
-            sep="\t",
-            index=False,
-            float_format="%.3f",
-            date_format='%Y-%m-%dT%H:%M:%S.%f',
-            columns=[
-                "time",
-                "magnitude",
-                "longitude",
-                "latitude",
-                "depth",
-                "sigma_time",
-                "sigma_amp",
-                "cov_time_amp",
-                "event_index",
-                "gamma_score"])
+    catalogs = catalogs[[
+        "time",
+        "magnitude",
+        "longitude",
+        "latitude",
+        "depth",
+        "sigma_time",
+        "sigma_amp",
+        "cov_time_amp",
+        "event_index",
+        "gamma_score"]]
 
     # Add assignment to picks
     assignments = DataFrame(
@@ -142,44 +281,35 @@ def assocciateWithGamma(config, st, et, proj):
             "pick_index",
             "event_index",
             "gamma_score"])
+    assignments = assignments[assignments["event_index"].isin(eventMap)].copy()
+    assignments["event_index"] = assignments["event_index"].map(eventMap)
 
-    picks_csv = os.path.join(
-        "results",
-        f"picks_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
     pick_df = pick_df.join(
         assignments.set_index("pick_index")
-    ).fillna(-1).astype({'event_index': int})
+    ).fillna({"event_index": -1, "gamma_score": -1}).astype({'event_index': int})
+    # Unassigned overlap picks belong to the neighbour day
+    pick_df = pick_df[(pick_df["event_index"] >= 0) | ownedEvents(
+        pick_df["timestamp"], st, et, config)].copy()
     pick_df["time"] = pick_df["timestamp"]
     pick_df["phase"] = pick_df["type"]
     pick_df["probability"] = pick_df["prob"]
     pick_df["station"] = pick_df["id"]
     pick_df["event_idx"] = pick_df["event_index"]
-    with open(picks_csv, "w") as fp:
-        pick_df.to_csv(
-            fp,
-            sep="\t",
-            index=False,
-            date_format='%Y-%m-%dT%H:%M:%S.%f',
-            columns=[
-                "station",
-                "time",
-                "phase",
-                "probability",
-                "phase_amp",
-                "event_idx",
-                "gamma_score"])
-    return True
+    pick_df["amplitude"] = pick_df["amp"]
+    pick_df = pick_df[[
+        "station",
+        "time",
+        "phase",
+        "probability",
+        "phase_amp",
+        "amplitude",
+        "event_idx",
+        "gamma_score"]]
+    return catalogs, pick_df
 
 
-def assocciateWithPyocto(config, st, et, proj):
-    picks = loadModel(os.path.join(
-        "results", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.jlib"))
-    stationxml = os.path.join(
-        "DB",
-        f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}",
-        "stations",
-        "*.xml")
-    inv = read_inventory(stationxml)
+def assocciateWithPyocto(config, st, et, proj, picks):
+    station_df = loadStationTable(config, proj, st, et)
     association_cutoff_distance = config["association_cutoff_distance"]
     time_before = config["time_before"]
     n_picks = config["n_picks"]
@@ -187,24 +317,7 @@ def assocciateWithPyocto(config, st, et, proj):
     n_s_picks = config["n_s_picks"]
     n_p_and_s_picks = config["n_p_and_s_picks"]
     n_threads = config["number_cpu"] or os.cpu_count() - 2
-    vp = array(config["vp"])
-    z = array(config["zz"])
-    vs = vp/config["vp_vs_ratio"]
-    model = {"vp": vp,
-             "vs": vs,
-             "depth": z}
-    model = DataFrame(model)
-    path = os.path.join("results", "vm.dat")
-    maxradius = d2k(config["maxradius"])
-    maxdepth = config["zlim_degree"][1]
-    pyocto.VelocityModel1D.create_model(model, 1.0, maxradius, maxdepth, path)
-    tolerance = config["tolerance"]
-    association_cutoff_distance = config["association_cutoff_distance"]
-    velocity_model = pyocto.VelocityModel1D(path,
-                                            tolerance,
-                                            association_cutoff_distance,
-                                            surface_p_velocity=vp[0],
-                                            surface_s_velocity=vs[0])
+    velocity_model = pyoctoVelocityModel(config)
     associator = pyocto.OctoAssociator.from_area(
         lat=config["ylim_degree"],
         lon=config["xlim_degree"],
@@ -217,54 +330,217 @@ def assocciateWithPyocto(config, st, et, proj):
         n_p_and_s_picks=n_p_and_s_picks,
         n_threads=n_threads,
     )
-    stations = associator.inventory_to_df(inv)
-    events, assignments = associator.associate_seisbench(picks, stations)
+    # Same rows as associator.inventory_to_df, without re-parsing StationXML
+    station_df["location"] = station_df["locations"].str.split(",")
+    station_df = station_df.explode("location", ignore_index=True)
+    stations = DataFrame({
+        "id": station_df["network"] + "." + station_df["station"] + "." +
+        station_df["location"],
+        "longitude": station_df["longitude"],
+        "latitude": station_df["latitude"],
+        "elevation": station_df["elevation(m)"]})
+    stations = associator.transform_stations(stations)
+    amplitudes = picks["amplitude"].values
+    picks = DataFrame({
+        "station": picks["trace_id"],
+        "time": picks["peak_time"],
+        "probability": picks["peak_value"],
+        "phase": picks["phase"]})
+    events, assignments = associator.associate(picks, stations)
     associator.transform_events(events)
+    events = events[ownedEvents(
+        events["time"], st.timestamp(), et.timestamp(), config)]
+    eventMap = dict(zip(events["idx"], range(len(events))))
+    events = events.reset_index(drop=True)
+    events["idx"] = range(len(events))
+    assignments = assignments[assignments["event_idx"].isin(eventMap)].copy()
+    assignments["event_idx"] = assignments["event_idx"].map(eventMap)
     if len(events) == 0:
-        return False
-    # save catalog
-    catalog_csv = os.path.join(
-        "results",
-        f"catalog_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
+        return None
     events["magnitude"] = nan
-    with open(catalog_csv, "w") as fp:
-        events.to_csv(
-            fp,
-            sep="\t",
-            index=False,
-            float_format="%.3f",
-            date_format='%Y-%m-%dT%H:%M:%S.%f',
-            columns=[
-                "time",
-                "longitude",
-                "latitude",
-                "depth",
-                "magnitude",
-                "picks",
-                "x",
-                "y",
-                "z",
-                "idx"])
-    # save picks
-    picks_csv = os.path.join(
+    events = events[[
+        "time",
+        "longitude",
+        "latitude",
+        "depth",
+        "magnitude",
+        "picks",
+        "x",
+        "y",
+        "z",
+        "idx"]]
+    assignments["amplitude"] = amplitudes[assignments["pick_idx"].values]
+    assignments = assignments[[
+        "event_idx",
+        "pick_idx",
+        "residual",
+        "station",
+        "time",
+        "probability",
+        "phase",
+        "amplitude"]]
+    return events, assignments
+
+
+def eventColumn(config):
+    return "event_index" if config["associator"] == "GaMMA" else "idx"
+
+
+def pickKeys(stations, phases, seconds):
+    """Identify picks by station, phase and time rounded to ms"""
+    # Parquet/Feather tables are read back with categorical codes
+    return stations.astype(str) + "_" + phases.astype(str).str.upper() + \
+        "_" + \
+        (seconds * 1e3).round().astype("int64").astype(str)
+
+
+def writeAssociation(st, et, catalog, picks, config):
+    writeTable(catalog, "catalog", st, et, config)
+    writeTable(picks, "picks", st, et, config)
+
+
+def readAssociation(st, et, config):
+    catalog = readTable("catalog", st, et, config)
+    picks = readTable("picks", st, et, config)
+    if catalog is None or picks is None:
+        return None
+    return catalog, picks
+
+
+def statePath(st, et, ext="json"):
+    return os.path.join(
         "results",
-        f"picks_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
-    assignments["amplitude"] = nan
-    with open(picks_csv, "w") as fp:
-        assignments.to_csv(
-            fp,
-            sep="\t",
-            index=False,
-            date_format='%Y-%m-%dT%H:%M:%S.%f',
-            columns=[
-                "event_idx",
-                "pick_idx",
-                "residual",
-                "station",
-                "time",
-                "probability",
-                "phase",
-                "amplitude"])
+        f"association_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.{ext}")
+
+
+def openWindow(config, st, et, picks):
+    """Split the picks of a day at the settled time of the previous run
+
+    Events of the previous run with origin before the settled time are
+    committed and kept as they are, with their picks. Only later picks
+    not used by a committed event are associated again. The new settled
+    time trails the latest pick by time_before plus
+    association_tail_margin.
+
+    Picks before the settled time that the previous run did not see, from
+    late or backfilled stations, are reported. With association_reopen
+    the settled time moves back to the earliest of them, so the events
+    they belong to are associated again.
+
+    Returns:
+        tuple: picks to associate, committed (catalog, picks) tables or
+        None, previous and new settled time in POSIX s and hashes of the
+        picks before the new settled time
+    """
+    settled, committed = -inf, None
+    hashes = hash_pandas_object(pickKeys(
+        picks["trace_id"], picks["phase"], picks["peak_time"]),
+        index=False).values
+    previous = readAssociation(st, et, config)
+    if os.path.exists(statePath(st, et)) and previous is not None:
+        with open(statePath(st, et)) as f:
+            settled = json.load(f)["settled"]
+        seen = load(statePath(st, et, "npy")) \
+            if os.path.exists(statePath(st, et, "npy")) else array([])
+        late = (picks["peak_time"] < settled) & ~isin(hashes, seen)
+        if late.any() and config["association_reopen"]:
+            settled = min(settled, picks["peak_time"][late].min() -
+                          config["time_before"] -
+                          config["association_tail_margin"])
+            print(f"+++ Reopening the window at {utc(settled)} for "
+                  f"{late.sum()} late pick(s)")
+        elif late.any():
+            print(f"+++ Ignoring {late.sum()} late pick(s) before the "
+                  f"settled time {utc(settled)}")
+        catalog, assigned = previous
+        catalog = catalog[toSeconds(catalog["time"]) < settled]
+        assigned = assigned[
+            assigned["event_idx"].isin(catalog[eventColumn(config)]) |
+            ((assigned["event_idx"] < 0) &
+             (toSeconds(assigned["time"]) < settled))]
+        used = pickKeys(assigned["station"], assigned["phase"],
+                        toSeconds(assigned["time"]))
+        fresh = ~pickKeys(picks["trace_id"], picks["phase"],
+                          picks["peak_time"]).isin(set(used))
+        committed = (catalog, assigned)
+    else:
+        fresh = picks["peak_time"] == picks["peak_time"]
+    newSettled = settled
+    window = (picks["peak_time"] >= settled) & fresh
+    if window.any():
+        newSettled = max(settled, picks["peak_time"][window].max() -
+                         config["time_before"] -
+                         config["association_tail_margin"])
+    seen = hashes[(picks["peak_time"] < newSettled).values]
+    return (picks[window].reset_index(drop=True), committed, settled,
+            newSettled, seen)
+
+
+def mergeCommitted(config, result, committed, settled):
+    """Append newly associated events to the committed ones
+
+    New events with origin before the settled time duplicate committed
+    ones and are dropped, event indices are renumbered after the
+    committed events.
+
+    Returns:
+        tuple: catalog and picks tables, None if both are empty
+    """
+    if result is not None:
+        # Committed tables come back from CSV with time strings, new ones
+        # hold datetimes or POSIX s, all are turned into timestamps first
+        result = (typedTable(result[0]), typedTable(result[1]))
+    if committed is None:
+        return result
+    eventId = eventColumn(config)
+    catalog, assigned = typedTable(committed[0]), typedTable(committed[1])
+    renumber = dict(zip(catalog[eventId], range(len(catalog))))
+    tables = [(catalog, assigned, renumber)]
+    if result is not None:
+        newCatalog, newPicks = result
+        newCatalog = newCatalog[toSeconds(newCatalog["time"]) >= settled]
+        newPicks = newPicks[newPicks["event_idx"].isin(newCatalog[eventId]) |
+                            (newPicks["event_idx"] < 0)]
+        renumber = dict(zip(newCatalog[eventId], range(
+            len(catalog), len(catalog) + len(newCatalog))))
+        tables.append((newCatalog, newPicks, renumber))
+    catalogs, picks = [], []
+    for catalog, assigned, renumber in tables:
+        catalog = catalog.copy()
+        catalog[eventId] = catalog[eventId].map(renumber)
+        assigned = assigned.copy()
+        assigned["event_idx"] = assigned["event_idx"].map(
+            renumber).fillna(-1).astype(int)
+        catalogs.append(catalog)
+        picks.append(assigned)
+    catalog, picks = concat(catalogs), concat(picks)
+    if len(catalog) == 0:
+        return None
+    return catalog, picks
+
+
+def associateDay(config, st, et):
+    proj = getProjection(config)
+    print(f"+++ Run {config['associator']} Associator on period: {st} - {et}")
+    picks = dayPicks(config, st, et)
+    if config["association_incremental"]:
+        picks, committed, settled, newSettled, seen = openWindow(
+            config, st, et, picks)
+        print(f"+++ Associating {len(picks)} picks of the open tail window")
+    result = None
+    if len(picks) and config["associator"] == "GaMMA":
+        result = assocciateWithGamma(config, st, et, proj, picks)
+    elif len(picks) and config["associator"] == "PyOcto":
+        result = assocciateWithPyocto(config, st, et, proj, picks)
+    if config["association_incremental"]:
+        result = mergeCommitted(config, result, committed, settled)
+    if result is None:
+        return False
+    writeAssociation(st, et, *result, config)
+    if config["association_incremental"]:
+        with open(statePath(st, et), "w") as f:
+            json.dump({"settled": newSettled}, f)
+        save(statePath(st, et, "npy"), seen)
     return True
 
 
@@ -275,13 +551,19 @@ def runAssociator(config):
     endTime = config["endtime"]
     startDateRange = date_range(startTime, endTime-td(days=1), freq="1D")
     endDateRange = date_range(startTime+td(days=1), endTime, freq="1D")
-    proj = Proj(f"+proj=sterea\
-                +lon_0={config['center'][0]}\
-                +lat_0={config['center'][1]}\
-                +units=km")
-    for st, et in zip(startDateRange, endDateRange):
-        print(f"+++ Run {config['associator']} Associator on period: {st} - {et}")
-        if config["associator"] == "GaMMA":
-            assocciateWithGamma(config, st, et, proj)
-        elif config["associator"] == "PyOcto":
-            assocciateWithPyocto(config, st, et, proj)
+    days = list(zip(startDateRange, endDateRange))
+    workers = config["association_workers"]
+    if workers <= 1:
+        for st, et in days:
+            associateDay(config, st, et)
+        return
+    prepareTravelTimes(config)
+    # Split the cores between the day workers
+    threads = max(1, (os.cpu_count() - 2) // workers)
+    dayConfig = {**config, "number_cpu": config["number_cpu"] or threads}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(associateDay, dayConfig, st, et)
+                   for st, et in days]
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc="+++ Associating days", unit="day"):
+            future.result()
@@ -4,8 +4,9 @@ from string import ascii_uppercase
 
 import numpy as np
 import proplot as plt
-from pandas import DataFrame, Series, read_csv
-from pyproj import Proj
+from pandas import DataFrame, read_csv
+
+from core.Projection import getProjection, projectColumns
 
 
 class Point:
@@ -104,13 +105,8 @@ def getEndSegments(xmin, xmax, ymin, ymax, width, theta):
 def load_xyzm(locator, proj):
     xyzmFile = os.path.join("results", "location", locator, f"xyzm_{locator}.dat")
     xyzm_df = read_csv(xyzmFile, delim_whitespace=True)
-    xyzm_df[[
-        "x(km)",
-        "y(km)"]] = xyzm_df.apply(lambda x: Series(
-            proj(longitude=x["Lon"],
-                 latitude=x["Lat"],
-                 inverse=False)),
-        axis=1)
+    xyzm_df = projectColumns(
+        proj, xyzm_df, ["Lon", "Lat"], ["x(km)", "y(km)"])
     xyzm_df["z(km)"] = xyzm_df.Dep
     return xyzm_df
 
@@ -123,13 +119,7 @@ def make_profile(config, proj, dx, dy, length, width, z, theta):
         "Width": width,
         "Z": z,
         "Orientation": theta}])
-    profile[[
-        "X",
-        "Y"]] = profile.apply(lambda x: Series(
-            proj(longitude=x["Lon"],
-                 latitude=x["Lat"],
-                 inverse=False)),
-        axis=1)
+    profile = projectColumns(proj, profile, ["Lon", "Lat"], ["X", "Y"])
     profile.X += dx
     profile.Y += dy
     return profile
@@ -160,8 +150,7 @@ def getProfileGeometry(config, proj, Profile):
 
 def plotCrossSection(config, locator):
     print(f"+++ Plotting cross sections for {locator} ...")
-    center_lon, center_lat = config["center"]
-    proj = Proj(f"+proj=sterea +lon_0={center_lon} +lat_0={center_lat} +units=km")
+    proj = getProjection(config)
     xyzm_df = load_xyzm(locator, proj)
 
     for P, Profile in enumerate(config["profiles"]):
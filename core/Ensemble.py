@@ -0,0 +1,84 @@
+from numpy import (arange, concatenate, diff, flatnonzero, float32, full,
+                   interp, isfinite, nan, nanmax, nanmean, stack)
+from obspy import Stream, Trace
+
+MERGE_METHODS = {"max": nanmax, "mean": nanmean}
+
+
+def memberConfigs(config):
+    """Get one configuration per ensemble member
+
+    Returns:
+        list: the configuration itself if no ensemble is set, otherwise a
+        copy per (picker, model) pair of ensemble_pickers
+    """
+    if not config["ensemble_pickers"]:
+        return [config]
+    return [{**config, "picker": picker, "model": model}
+            for picker, model in config["ensemble_pickers"]]
+
+
+def finiteSegments(data):
+    """Get (start, end) index ranges of the finite runs of an array"""
+    finite = concatenate([[False], isfinite(data), [False]])
+    edges = flatnonzero(diff(finite.astype(int)))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def mergeAnnotations(members, method="max"):
+    """Merge P/S probability traces of several pickers on a common grid
+
+    Annotations of each member are interpolated onto a grid spanning all
+    members of a station at the highest sampling rate, then combined with
+    nanmax or nanmean, so a member without coverage does not hide the
+    others.
+
+    Args:
+        members (list): annotation streams, one per picker
+        method (str, optional): "max" or "mean". Defaults to "max".
+
+    Returns:
+        obspy.Stream: "Ensemble_P" and "Ensemble_S" traces per station,
+        one per covered segment
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown ensemble merge '{method}', "
+                         f"use one of {list(MERGE_METHODS)}")
+    merged = Stream()
+    allTraces = Stream([tr for annotations in members for tr in annotations])
+    stationIds = sorted(set([
+        (tr.stats.network, tr.stats.station, tr.stats.location)
+        for tr in allTraces]))
+    for net, sta, loc in stationIds:
+        for phase in ["P", "S"]:
+            traces = [tr for tr in allTraces.select(
+                network=net, station=sta, location=loc)
+                if tr.stats.channel.endswith(f"_{phase}")]
+            if not traces:
+                continue
+            sr = max([tr.stats.sampling_rate for tr in traces])
+            t0 = min([tr.stats.starttime for tr in traces])
+            t1 = max([tr.stats.endtime for tr in traces])
+            grid = arange(int(round((t1 - t0) * sr)) + 1) / sr
+            stacked = []
+            for annotations in members:
+                values = full(len(grid), nan, dtype=float32)
+                for tr in annotations.select(
+                        network=net, station=sta, location=loc):
+                    if not tr.stats.channel.endswith(f"_{phase}"):
+                        continue
+                    times = tr.stats.starttime - t0 + tr.times()
+                    inside = (grid >= times[0]) & (grid <= times[-1])
+                    values[inside] = interp(grid[inside], times, tr.data)
+                stacked.append(values)
+            combined = MERGE_METHODS[method](stack(stacked), axis=0)
+            for i0, i1 in finiteSegments(combined):
+                merged.append(Trace(
+                    data=combined[i0:i1].astype(float32),
+                    header={"network": net,
+                            "station": sta,
+                            "location": loc,
+                            "channel": f"Ensemble_{phase}",
+                            "starttime": t0 + i0 / sr,
+                            "sampling_rate": sr}))
+    return merged
@@ -4,12 +4,13 @@ from datetime import timedelta as td
 from numpy import array, isnan
 from obspy import UTCDateTime as utc
 from obspy.core import event
-from pandas import Series, date_range, read_csv
-from pyproj import Proj
+from pandas import date_range
 from tqdm import tqdm
 
 from core.Extra import weightMapper
 from core.PrepareData import prepareInventory
+from core.Projection import getProjection, projectColumns
+from core.Tables import readTable, toSeconds
 
 
 class feedCatalog():
@@ -31,7 +32,7 @@ class feedCatalog():
         pick = event.Pick()
         phase_score = eventPick["probability"]
         phase_type = eventPick["phase"]
-        phase_time = eventPick["time"]
+        phase_time = eventPick["seconds"]
         station_id = eventPick["station"]
         pick.onset = "impulsive" if phase_score > 0.7 else "emergent"
         pick.phase_hint = phase_type.upper()
@@ -66,8 +67,10 @@ class feedCatalog():
             obspy.pick: an obspy pick object
         """
         pick = event.Pick()
-        pick.phase_hint = "IAML"
-        pick.time = utc(eventPick["time"])
+        # Stored amplitudes are peak velocity unless Wood-Anderson is used
+        woodAnderson = self.config["amplitude_wood_anderson"]
+        pick.phase_hint = "IAML" if woodAnderson else "AMP"
+        pick.time = utc(eventPick["seconds"])
         net, sta, loc = eventPick["station"].split(".")
         chn = "BHE"
         pick.waveform_id = event.WaveformStreamID(
@@ -89,7 +92,7 @@ class feedCatalog():
         """
         arrival = event.Arrival()
         arrival.phase = eventPick["phase"].upper()
-        arrival.time = utc(eventPick["time"])
+        arrival.time = utc(eventPick["seconds"])
         arrival.pick_id = pick_id
         return arrival
 
@@ -103,19 +106,24 @@ class feedCatalog():
             obspy.event.amplitude: an obspy amplitude object
         """
         amplitude = event.magnitude.Amplitude()
-        amplitude.generic_amplitude = eventPick["amplitude"] * \
-            1e-2 if eventPick["amplitude"] else 0
+        amplitude.generic_amplitude = eventPick["amplitude"] \
+            if eventPick["amplitude"] > 0 else 0
         amplitude.period = 1.0
-        amplitude.type = "A"
         amplitude.category = "point"
-        amplitude.unit = "m"
         amplitude.pick_id = pick_id
         net, sta, loc = eventPick["station"].split(".")
         amplitude.waveform_id = event.WaveformStreamID(
             network_code=net,
             station_code=sta,
             location_code=loc)
-        amplitude.magnitude_hint = "ML"
+        if self.config["amplitude_wood_anderson"]:
+            # Wood-Anderson displacement, usable for local magnitudes
+            amplitude.type = "AML"
+            amplitude.unit = "m"
+            amplitude.magnitude_hint = "ML"
+        else:
+            amplitude.type = "V"
+            amplitude.unit = "m/s"
         amplitude.evaluation_mode = "automatic"
         amplitude.evaluation_status = "preliminary"
         return amplitude
@@ -175,7 +183,7 @@ class feedCatalog():
             obspy.origin: an obspy origin object
         """
         origin = event.Origin()
-        origin.time = utc(eventInfo["time"])
+        origin.time = utc(eventInfo["seconds"])
         origin.latitude = eventInfo["latitude"]
         origin.longitude = eventInfo["longitude"]
         origin.depth = eventInfo["depth"]*1e3
@@ -246,32 +254,22 @@ class feedCatalog():
             "NORDIC": "out",
             "SC3ML": "xml",
             "QUAKEML": "xml"}
-        proj = Proj(f"+proj=sterea\
-                    +lon_0={config['center'][0]}\
-                    +lat_0={config['center'][1]}\
-                    +units=km")
+        proj = getProjection(config)
         for st, et in tqdm(
                 zip(startDateRange, endDateRange),
                 desc="+++ Exporting catalogs"):
-            catalog = os.path.join(
-                "results",
-                f"catalog_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
-            pick = os.path.join(
-                "results",
-                f"picks_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
-            if not os.path.exists(catalog) and not os.path.exists(pick):
+            catalog_df = readTable("catalog", st, et, config)
+            pick_df = readTable("picks", st, et, config)
+            if catalog_df is None or pick_df is None:
                 continue
-            catalog_df = read_csv(catalog, sep="\t")
-            catalog_df.sort_values(by=["time"], inplace=True)
-            pick_df = read_csv(pick, sep="\t")
+            # POSIX seconds once per table, not a string parse per row
+            catalog_df["seconds"] = toSeconds(catalog_df["time"])
+            pick_df["seconds"] = toSeconds(pick_df["time"])
+            catalog_df.sort_values(by=["seconds"], inplace=True)
             station_df, station_dict = prepareInventory(config, proj, st, et)
-            catalog_df[[
-                "x(km)",
-                "y(km)"]] = catalog_df.apply(lambda x: Series(
-                    proj(longitude=x["longitude"],
-                         latitude=x["latitude"],
-                         inverse=False)),
-                axis=1)
+            catalog_df = projectColumns(
+                proj, catalog_df,
+                ["longitude", "latitude"], ["x(km)", "y(km)"])
             catalog_df["z(km)"] = catalog_df["depth"]
             cat = self.setCatalog(catalog_df, pick_df, station_df)
             for fmt in config["outCatFmt"]:
@@ -1,4 +1,5 @@
 import os
+import resource
 import sys
 from glob import glob
 from pathlib import Path
@@ -30,6 +31,54 @@ def divide_chunks(List, n):
         yield List[i:i + n]
 
 
+def budget_chunks(List, sizes, budget):
+    """Split a list into consecutive chunks within a size budget
+
+    Args:
+        List (list): items to split
+        sizes (list): size of each item
+        budget (float): maximum summed size of a chunk, an item larger than
+        the budget forms a chunk on its own
+
+    Yields:
+        list: a chunk of items
+    """
+    chunk, total = [], 0
+    for item, size in zip(List, sizes):
+        if chunk and total + size > budget:
+            yield chunk
+            chunk, total = [], 0
+        chunk.append(item)
+        total += size
+    if chunk:
+        yield chunk
+
+
+def resetPeakMemory():
+    """Reset the peak resident set size of this process (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peakMemory():
+    """Get the peak resident set size of this process
+
+    Returns:
+        float: peak RSS in MB since start or since last resetPeakMemory
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
 def handle_masked_arr(st):
     for tr in st:
         if isinstance(tr.data, ma.masked_array):
@@ -0,0 +1,130 @@
+import os
+from copy import deepcopy
+from hashlib import sha1
+from pathlib import Path
+
+import torch
+from numpy import abs, argmin, array, max, median, nanmax
+
+from core.AnnotationStore import picksFromAnnotations
+
+BACKENDS = ["fp32", "int8", "torchscript", "int8+torchscript"]
+
+
+def weightsHash(picker):
+    """Hash of the weights version and fp32 weights of a picker"""
+    h = sha1(str(getattr(picker, "_weights_version", "")).encode())
+    for name, tensor in picker.state_dict().items():
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().numpy().tobytes())
+    return h.hexdigest()[:12]
+
+
+def artifactPath(config, picker):
+    """Path of the cached TorchScript artifact of a picker/backend pair
+
+    Frozen graphs hold the weights, so the name includes their hash and
+    updated weights get a new artifact.
+    """
+    backend = config["inference_backend"].replace("+", "_")
+    name = (f"{config['picker']}_{config['model']}_{backend}_"
+            f"{picker.in_samples}_{weightsHash(picker)}_"
+            f"torch{torch.__version__}.pt")
+    return os.path.join("models", name)
+
+
+def optimizePicker(picker, config):
+    """Build a fast CPU copy of a SeisBench picker
+
+    "int8" applies dynamic int8 quantization to Linear and LSTM layers,
+    "torchscript" replaces forward by a traced and frozen graph cached in
+    models/, "int8+torchscript" does both. Pre and post processing of
+    annotate/classify are untouched.
+
+    Args:
+        picker (seisbench.models.WaveformModel): fp32 picker
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        seisbench.models.WaveformModel: the optimized picker
+    """
+    backend = config["inference_backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', use one of {BACKENDS}")
+    fast = deepcopy(picker).cpu().eval()
+    path = artifactPath(config, fast) if "torchscript" in backend else None
+    if path is not None and os.path.exists(path):
+        # The cached graph holds the (quantized) weights, no need to rebuild
+        object.__setattr__(fast, "forward", torch.jit.load(path))
+        return fast
+    if "int8" in backend:
+        fast = torch.ao.quantization.quantize_dynamic(
+            fast, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+        nQuantized = len([
+            m for m in fast.modules()
+            if m.__class__.__module__.startswith("torch.ao.nn.quantized")])
+        if nQuantized == 0:
+            print(f"+++ {config['picker']} has no Linear/LSTM layers, "
+                  "int8 quantization leaves it unchanged.")
+    if "torchscript" in backend:
+        Path("models").mkdir(parents=True, exist_ok=True)
+        example = torch.zeros(
+            2, len(fast.component_order), fast.in_samples)
+        with torch.no_grad():
+            traced = torch.jit.trace(fast, example, check_trace=False)
+        traced = torch.jit.freeze(traced.eval())
+        torch.jit.save(traced, path)
+        # Instance attribute, so nn.Module does not register it as a child
+        object.__setattr__(fast, "forward", traced)
+    return fast
+
+
+def matchPicks(basePicks, testPicks, tolerance=1.0):
+    """Match picks of the same trace and phase within a time tolerance
+
+    Returns:
+        tuple: number of matched picks, pick time differences (s) and
+        peak probability differences
+    """
+    dts, dps = [], []
+    for pick in basePicks:
+        candidates = [p for p in testPicks
+                      if p.trace_id == pick.trace_id and p.phase == pick.phase]
+        if not candidates:
+            continue
+        dt = array([p.peak_time - pick.peak_time for p in candidates])
+        i = argmin(abs(dt))
+        if abs(dt[i]) <= tolerance:
+            dts.append(dt[i])
+            dps.append(candidates[i].peak_value - pick.peak_value)
+    return len(dts), array(dts), array(dps)
+
+
+def parityCheck(baseline, fast, stream, config):
+    """Compare the optimized picker with the fp32 baseline on a stream
+
+    Reports the largest probability difference and the pick time and
+    peak probability differences of matched picks.
+    """
+    window = config["inference_parity_seconds"]
+    t0 = min([tr.stats.starttime for tr in stream])
+    stream = stream.slice(t0, t0 + window)
+    kwargs = {"overlap": config["overlap"], "batch_size": config["batch_size"]}
+    baseAnnotations = baseline.annotate(stream, **kwargs)
+    testAnnotations = fast.annotate(stream, **kwargs)
+    maxDiff = 0.0
+    for tr in baseAnnotations:
+        other = testAnnotations.select(id=tr.id)
+        if len(other) and len(other[0].data) == len(tr.data):
+            maxDiff = max([maxDiff, nanmax(abs(other[0].data - tr.data))])
+    basePicks = picksFromAnnotations(baseAnnotations, config)
+    testPicks = picksFromAnnotations(testAnnotations, config)
+    nMatched, dts, dps = matchPicks(basePicks, testPicks)
+    print(f"+++ Parity {config['inference_backend']} vs fp32 on {window} s: "
+          f"max probability difference {maxDiff:.4f}, "
+          f"{nMatched}/{len(basePicks)} baseline picks matched "
+          f"({len(testPicks)} picks in {config['inference_backend']})")
+    if nMatched:
+        print(f"+++ Pick time difference: median {median(abs(dts)):.3f} s, "
+              f"max {max(abs(dts)):.3f} s; "
+              f"probability difference: max {max(abs(dps)):.4f}")
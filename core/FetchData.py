@@ -1,4 +1,10 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta as td
+from glob import glob
+from pathlib import Path
+from time import perf_counter
 
 from obspy.clients.fdsn.mass_downloader import (CircularDomain, MassDownloader,
                                                 Restrictions)
@@ -6,6 +12,88 @@ from pandas import date_range
 from tqdm import tqdm
 
 
+def readManifest(dayPath):
+    """Read the download manifest of a day
+
+    Args:
+        dayPath (str): path to the day directory in DB
+
+    Returns:
+        dict: completed networks with their bytes on disk and failed
+        networks with the reason and number of attempts, the latter are
+        retried on resume until download_max_attempts is reached
+    """
+    manifestFile = os.path.join(dayPath, "manifest.json")
+    if not os.path.exists(manifestFile):
+        return {"networks": {}, "failed": {}}
+    with open(manifestFile) as f:
+        manifest = json.load(f)
+    manifest.setdefault("failed", {})
+    return manifest
+
+
+def writeManifest(dayPath, manifest):
+    Path(dayPath).mkdir(parents=True, exist_ok=True)
+    manifestFile = os.path.join(dayPath, "manifest.json")
+    with open(f"{manifestFile}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifestFile}.tmp", manifestFile)
+
+
+def recordFailure(manifest, network, reason):
+    entry = manifest["failed"].get(network)
+    attempts = entry["attempts"] if isinstance(entry, dict) else 0
+    manifest["failed"][network] = {"reason": reason, "attempts": attempts + 1}
+
+
+def isFinal(manifest, network, config):
+    """Check whether a network of a day needs no further download"""
+    entry = manifest["failed"].get(network)
+    return network in manifest["networks"] or (
+        isinstance(entry, dict) and
+        entry["attempts"] >= config["download_max_attempts"])
+
+
+def downloadedBytes(dayPath, network):
+    files = glob(os.path.join(dayPath, "waveforms", f"{network}.*.mseed"))
+    files += glob(os.path.join(dayPath, "stations", f"{network}.*.xml"))
+    return sum([os.path.getsize(f) for f in files])
+
+
+def downloadDay(config, domain, st, et, network):
+    """Download one network of one day
+
+    Returns:
+        tuple: bytes written by this download and bytes of the network
+        on disk after it
+    """
+    dayPath = os.path.join(
+        "DB", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}")
+
+    # Data Restrictions
+    restrictions = Restrictions(
+        starttime=st,
+        endtime=et,
+        reject_channels_with_gaps=False,
+        chunklength_in_sec=86400,
+        minimum_length=0.0,
+        network=network,
+        channel_priorities=["HH[ENZ]", "BH[ENZ]", "SH[ENZ]", "HN[ENZ]"],
+        sanitize=True,
+    )
+
+    # Download Data
+    before = downloadedBytes(dayPath, network)
+    mdl = MassDownloader(config["fdsn_urls"], configure_logging=False)
+    mdl.download(
+        domain,
+        restrictions,
+        mseed_storage=os.path.join(dayPath, "waveforms"),
+        stationxml_storage=os.path.join(dayPath, "stations"))
+    after = downloadedBytes(dayPath, network)
+    return after - before, after
+
+
 def fetchRawWaveforms(config):
 
     # Data Time Span
@@ -22,27 +110,63 @@ def fetchRawWaveforms(config):
         minradius=config["minradius"],
         maxradius=config["maxradius"])
 
-    for st, et in tqdm(
-            zip(startDateRange, endDateRange),
+    # Work units are (day, network), finished ones are taken from manifests
+    manifests, units = {}, []
+    for st, et in zip(startDateRange, endDateRange):
+        dayPath = os.path.join(
+            "DB", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}")
+        manifests[dayPath] = readManifest(dayPath)
+        for network in config["networks"]:
+            if config["download_resume"] and \
+                    isFinal(manifests[dayPath], network, config):
+                continue
+            units.append((dayPath, st, et, network))
+    skipped = len(startDateRange) - len(set([u[0] for u in units]))
+    if skipped:
+        print(f"+++ Skipping {skipped} day(s) already downloaded.")
+
+    totalBytes, daysDone = 0, 0
+    remaining = {}
+    for dayPath, *_ in units:
+        remaining[dayPath] = remaining.get(dayPath, 0) + 1
+    tic = perf_counter()
+    with ThreadPoolExecutor(max_workers=config["download_workers"]) as pool:
+        futures = {
+            pool.submit(downloadDay, config, domain, st, et, network):
+            (dayPath, network) for dayPath, st, et, network in units}
+        pbar = tqdm(
+            as_completed(futures),
+            total=len(futures),
             desc="+++ Downloading waveforms",
-            unit="day"):
-
-        # Data Restrictions
-        restrictions = Restrictions(
-            starttime=st,
-            endtime=et,
-            reject_channels_with_gaps=False,
-            chunklength_in_sec=86400,
-            minimum_length=0.0,
-            network=",".join(config["networks"]),
-            channel_priorities=["HH[ENZ]", "BH[ENZ]", "SH[ENZ]", "HN[ENZ]"],
-            sanitize=True,
-        )
-
-        # Download Data
-        mdl = MassDownloader(config["fdsn_urls"], configure_logging=False)
-        mdl.download(
-            domain,
-            restrictions,
-            mseed_storage=f"DB/{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}/waveforms",
-            stationxml_storage=f"DB/{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}/stations")
+            unit="day-network")
+        for future in pbar:
+            dayPath, network = futures[future]
+            manifest = manifests[dayPath]
+            try:
+                nBytes, onDisk = future.result()
+            except Exception as e:
+                print(f"\n+++ Download failed for {network} in {dayPath}: {e}")
+                recordFailure(manifest, network, repr(e))
+                writeManifest(dayPath, manifest)
+                continue
+            totalBytes += nBytes
+            # MassDownloader logs service errors instead of raising, so a
+            # network without data is retried up to download_max_attempts
+            if onDisk == 0:
+                recordFailure(manifest, network, "no data")
+                writeManifest(dayPath, manifest)
+                continue
+            manifest["networks"][network] = onDisk
+            manifest["failed"].pop(network, None)
+            writeManifest(dayPath, manifest)
+            remaining[dayPath] -= 1
+            if remaining[dayPath] == 0:
+                daysDone += 1
+            elapsed = perf_counter() - tic
+            pbar.set_postfix({
+                "MB/s": f"{totalBytes/elapsed/1e6:.2f}",
+                "days/hour": f"{daysDone/elapsed*3600:.1f}"})
+    elapsed = perf_counter() - tic
+    if units:
+        print(f"+++ Downloaded {totalBytes/1e6:.1f} MB for {daysDone} day(s) in {elapsed:.1f} s "
+              f"({totalBytes/elapsed:.0f} bytes/s, {daysDone/elapsed*3600:.1f} days/hour).")
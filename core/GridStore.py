@@ -0,0 +1,112 @@
+import json
+import os
+from pathlib import Path
+
+from numpy import ceil, floor, lib, nan
+from obspy import Stream, Trace
+from obspy import UTCDateTime as utc
+
+
+def mergeRanges(ranges):
+    merged = []
+    for i0, i1 in sorted(ranges):
+        if merged and i0 <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], i1)
+        else:
+            merged.append([i0, i1])
+    return merged
+
+
+def writeGrid(stream, path, dtype, extra=None):
+    """Write a stream as (channel, sample) arrays per NET.STA.LOC
+
+    Each location gets a .npy array on a common time grid and a .json
+    header with the start time, sampling rate, channel names, the sample
+    ranges covered by data and the gaps between them. Gap samples are NaN.
+
+    Args:
+        stream (obspy.Stream): traces to store
+        path (str): output directory
+        dtype (numpy.dtype): array data type
+        extra (dict, optional): more header entries. Defaults to None.
+    """
+    Path(path).mkdir(parents=True, exist_ok=True)
+    stream = stream.split()
+    stationIds = sorted(set([
+        f"{tr.stats.network}.{tr.stats.station}.{tr.stats.location}"
+        for tr in stream]))
+    for stationId in stationIds:
+        net, sta, loc = stationId.split(".")
+        sub = stream.select(network=net, station=sta, location=loc)
+        channels = sorted(set([tr.stats.channel for tr in sub]))
+        sr = sub[0].stats.sampling_rate
+        t0 = min([tr.stats.starttime for tr in sub])
+        t1 = max([tr.stats.endtime for tr in sub])
+        npts = int(round((t1 - t0) * sr)) + 1
+        arr = lib.format.open_memmap(
+            os.path.join(path, f"{stationId}.npy"),
+            mode="w+", dtype=dtype, shape=(len(channels), npts))
+        arr[:] = nan
+        segments = {channel: [] for channel in channels}
+        for tr in sub:
+            i0 = int(round((tr.stats.starttime - t0) * sr))
+            i1 = min(i0 + tr.stats.npts, npts)
+            arr[channels.index(tr.stats.channel), i0:i1] = tr.data[:i1 - i0]
+            segments[tr.stats.channel].append([i0, i1])
+        arr.flush()
+        del arr
+        segments = {c: mergeRanges(r) for c, r in segments.items()}
+        gaps = {c: [[a[1], b[0]] for a, b in zip(r[:-1], r[1:])]
+                for c, r in segments.items()}
+        header = {
+            "starttime": str(t0),
+            "sampling_rate": sr,
+            "npts": npts,
+            "channels": channels,
+            "segments": segments,
+            "gaps": gaps,
+            **(extra or {}),
+        }
+        with open(os.path.join(path, f"{stationId}.json"), "w") as f:
+            json.dump(header, f)
+
+
+def readGrid(headerFile, starttime=None, endtime=None, keep=None):
+    """Read one stored NET.STA.LOC array without copying
+
+    Args:
+        headerFile (str): path to the .json header
+        starttime (UTCDateTime, optional): window start. Defaults to None.
+        endtime (UTCDateTime, optional): window end. Defaults to None.
+        keep (callable, optional): channel name filter. Defaults to None.
+
+    Returns:
+        obspy.Stream: one trace per channel and data segment, each a view
+        into the memory-mapped array
+    """
+    with open(headerFile) as f:
+        header = json.load(f)
+    net, sta, loc = os.path.basename(headerFile)[:-5].split(".")
+    arr = lib.format.open_memmap(headerFile[:-5] + ".npy", mode="r")
+    t0 = utc(header["starttime"])
+    sr = header["sampling_rate"]
+    first = 0 if starttime is None else int(ceil((starttime - t0) * sr))
+    last = arr.shape[1] if endtime is None else \
+        int(floor((endtime - t0) * sr)) + 1
+    stream = Stream()
+    for c, channel in enumerate(header["channels"]):
+        if keep is not None and not keep(channel):
+            continue
+        for i0, i1 in header["segments"][channel]:
+            i0, i1 = max(i0, first), min(i1, last)
+            if i1 <= i0:
+                continue
+            stream.append(Trace(
+                data=arr[c, i0:i1],
+                header={"network": net,
+                        "station": sta,
+                        "location": loc,
+                        "channel": channel,
+                        "starttime": t0 + i0 / sr,
+                        "sampling_rate": sr}))
+    return stream
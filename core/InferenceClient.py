@@ -0,0 +1,79 @@
+import threading
+from multiprocessing.connection import Client
+from multiprocessing.shared_memory import SharedMemory
+
+import seisbench.models as sbm
+import torch
+from numpy import ascontiguousarray, ndarray
+
+
+class RemoteForward():
+    """Forward pass of a picker run by the local inference server
+
+    Input windows go to the server through a shared memory block, outputs
+    come back the same way, only block names and shapes cross the socket.
+    """
+
+    def __init__(self, address, key):
+        self.key = key
+        self.conn = Client(address, family="AF_UNIX")
+        self.lock = threading.Lock()
+
+    def request(self, *message):
+        with self.lock:
+            self.conn.send(message)
+            status, payload = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Inference server failed: {payload}")
+        return payload
+
+    def __call__(self, x):
+        x = ascontiguousarray(x.detach().cpu().numpy())
+        shm = SharedMemory(create=True, size=max(x.nbytes, 1))
+        try:
+            ndarray(x.shape, dtype=x.dtype, buffer=shm.buf)[:] = x
+            name, layout, isTuple = self.request(
+                "forward", self.key, shm.name, x.shape, x.dtype.str)
+        finally:
+            shm.close()
+            shm.unlink()
+        out = SharedMemory(name=name)
+        outputs = tuple([
+            torch.from_numpy(ndarray(
+                shape, dtype=dtype, buffer=out.buf, offset=offset).copy())
+            for shape, dtype, offset in layout])
+        out.close()
+        out.unlink()
+        return outputs if isTuple else outputs[0]
+
+
+def remotePicker(config):
+    """Build a picker whose forward pass runs on the inference server
+
+    The model is created from the server's model arguments and weight
+    metadata, so windowing, normalization and pick extraction stay local
+    while no weights are loaded in this process.
+
+    Args:
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        seisbench.models.WaveformModel: the proxy picker
+    """
+    key = (config["picker"], config["model"], config["model_update"])
+    forward = RemoteForward(config["inference_socket"], key)
+    state = forward.request("model", key)
+    picker = getattr(sbm, config["picker"])(**state["model_args"])
+    if state["metadata"] is not None:
+        picker._weights_metadata = state["metadata"]
+        picker._parse_metadata()
+    picker.eval()
+    # Instance attribute, so nn.Module does not register it as a child
+    object.__setattr__(picker, "forward", forward)
+    return picker
+
+
+def serverStats(config):
+    """Get the queue depth and latency report of the inference server"""
+    key = (config["picker"], config["model"], config["model_update"])
+    return RemoteForward(config["inference_socket"], key).request("stats")
@@ -0,0 +1,180 @@
+import os
+import queue
+import threading
+from collections import deque
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Listener
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter, sleep
+
+import torch
+from numpy import ascontiguousarray, concatenate, mean, ndarray, percentile
+
+from core.Ensemble import memberConfigs
+from core.Extra import readConfiguration
+from core.Picker import getPicker
+
+
+def writeShared(arrays, isTuple):
+    """Copy output arrays into one shared memory block for a client
+
+    Returns:
+        tuple: block name, (shape, dtype, offset) per array and whether the
+        model returned a tuple
+    """
+    arrays = [ascontiguousarray(a) for a in arrays]
+    shm = SharedMemory(create=True, size=max(sum([a.nbytes for a in arrays]), 1))
+    layout, offset = [], 0
+    for a in arrays:
+        ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=offset)[:] = a
+        layout.append((a.shape, a.dtype.str, offset))
+        offset += a.nbytes
+    # The client unlinks the block after copying it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    name = shm.name
+    shm.close()
+    return name, layout, isTuple
+
+
+class InferenceServer():
+    """Hold picker models once and serve forward calls of many pipelines
+
+    Window requests of all clients are queued per model and merged into
+    batches of up to inference_server_batch windows, waiting at most
+    inference_server_wait_ms for more requests after the first one.
+    """
+
+    def __init__(self, config):
+        self.config = {**config, "inference_server": False}
+        self.models, self.queues = {}, {}
+        for member in memberConfigs(self.config):
+            key = (member["picker"], member["model"], member["model_update"])
+            self.models[key] = getPicker(member)
+            self.queues[key] = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=100000)
+        self.depths = deque(maxlen=100000)
+        self.batches = deque(maxlen=100000)
+
+    def serve(self):
+        address = self.config["inference_socket"]
+        if os.path.exists(address):
+            os.remove(address)
+        for key in self.models:
+            threading.Thread(target=self.batcher, args=(key,), daemon=True).start()
+        threading.Thread(target=self.reporter, daemon=True).start()
+        with Listener(address, family="AF_UNIX") as listener:
+            print(f"+++ Inference server serving {list(self.models)} on {address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(
+                    target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send(("ok", self.dispatch(request)))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def dispatch(self, request):
+        kind, *args = request
+        if kind == "model":
+            model = self.models[args[0]]
+            return {"model_args": model.get_model_args(),
+                    "metadata": getattr(model, "_weights_metadata", None)}
+        if kind == "forward":
+            key, name, shape, dtype = args
+            shm = SharedMemory(name=name)
+            # The client owns the block
+            resource_tracker.unregister(shm._name, "shared_memory")
+            x = ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+            shm.close()
+            result = queue.Queue(maxsize=1)
+            with self.lock:
+                self.depths.append(self.queues[key].qsize())
+            self.queues[key].put((x, result, perf_counter()))
+            outputs = result.get()
+            if isinstance(outputs, Exception):
+                raise outputs
+            return outputs
+        if kind == "stats":
+            return self.stats()
+        raise ValueError(f"Unknown request '{kind}'")
+
+    def batcher(self, key):
+        model = self.models[key]
+        requests = self.queues[key]
+        maxWindows = self.config["inference_server_batch"]
+        wait = self.config["inference_server_wait_ms"] * 1e-3
+        while True:
+            batch = [requests.get()]
+            nWindows = len(batch[0][0])
+            deadline = perf_counter() + wait
+            while nWindows < maxWindows:
+                try:
+                    request = requests.get(
+                        timeout=max(0.0, deadline - perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                nWindows += len(request[0])
+            try:
+                x = torch.from_numpy(concatenate([r[0] for r in batch]))
+                with torch.no_grad():
+                    y = model(x.to(model.device))
+                isTuple = isinstance(y, tuple)
+                ys = [t.cpu().numpy() for t in (y if isTuple else (y,))]
+                start = 0
+                for windows, result, tic in batch:
+                    end = start + len(windows)
+                    result.put(writeShared([t[start:end] for t in ys], isTuple))
+                    start = end
+                    with self.lock:
+                        self.latencies.append(perf_counter() - tic)
+                with self.lock:
+                    self.batches.append((len(batch), nWindows))
+            except Exception as e:
+                for _, result, _ in batch:
+                    result.put(e)
+
+    def stats(self):
+        """Queue depth, latency and batch size summary since start"""
+        with self.lock:
+            latencies = list(self.latencies)
+            depths = list(self.depths)
+            batches = list(self.batches)
+        if not latencies:
+            return {"requests": 0}
+        return {
+            "requests": len(latencies),
+            "latency_mean_ms": mean(latencies) * 1e3,
+            "latency_p95_ms": percentile(latencies, 95) * 1e3,
+            "queue_depth_mean": mean(depths),
+            "queue_depth_max": max(depths),
+            "batch_requests_mean": mean([b[0] for b in batches]),
+            "batch_windows_mean": mean([b[1] for b in batches]),
+        }
+
+    def reporter(self):
+        while True:
+            sleep(self.config["inference_server_report"])
+            stats = self.stats()
+            if not stats["requests"]:
+                continue
+            print(f"+++ {stats['requests']} requests, latency mean "
+                  f"{stats['latency_mean_ms']:.1f} ms / p95 "
+                  f"{stats['latency_p95_ms']:.1f} ms, queue depth mean "
+                  f"{stats['queue_depth_mean']:.1f} / max "
+                  f"{stats['queue_depth_max']}, "
+                  f"{stats['batch_requests_mean']:.1f} requests "
+                  f"({stats['batch_windows_mean']:.0f} windows) per batch")
+
+
+if __name__ == "__main__":
+    InferenceServer(readConfiguration()).serve()
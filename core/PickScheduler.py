@@ -0,0 +1,184 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta as td
+from glob import glob
+from pathlib import Path
+from time import perf_counter
+
+import torch
+from obspy import UTCDateTime as utc
+from obspy import read_inventory
+from pandas import date_range
+from seisbench.util import PickList
+from tqdm import tqdm
+
+from core.Amplitude import measureAmplitudes
+from core.Extra import handle_masked_arr
+from core.Ensemble import memberConfigs
+from core.Picker import (_baselines, getPicker, mergeDayPicks, pickChunk,
+                         saveDayPicks, stationsToPick)
+from core.PickStore import picksToArray
+from core.PrepareData import loadStationTable
+from core.Projection import getProjection
+from core.WaveformIndex import WaveformIndex
+
+_worker = {}
+# Picker stages that only run in core.Picker.pickStations
+UNSUPPORTED = ["trigger_gating", "store_annotations", "preprocess_float32",
+               "array_archive"]
+
+
+def initPickWorker(config):
+    """Load the model once per worker with a fixed torch thread count"""
+    torch.set_num_threads(config["picker_worker_threads"])
+    _worker["config"] = {**config, "picker_parallelism": 1}
+    _worker["pickers"] = [
+        getPicker(member) for member in memberConfigs(_worker["config"])]
+    # No parity check runs here, do not keep the fp32 copies alive
+    _baselines.clear()
+    _worker["index"] = WaveformIndex()
+    _worker["inventories"] = {}
+
+
+def dayInventory(day):
+    """Read the responses of a day once per worker, None if unreadable"""
+    if day not in _worker["inventories"]:
+        try:
+            inventory = read_inventory(
+                os.path.join("DB", day, "stations", "*.xml"))
+        except Exception:
+            inventory = None
+        _worker["inventories"][day] = inventory
+    return _worker["inventories"][day]
+
+
+def pickUnit(unit):
+    """Pick one (station, time-shard) work unit inside a worker
+
+    Args:
+        unit (tuple): day key, station, padded shard start/end and the
+        owned time range of the shard
+
+    Returns:
+        tuple: day key and the picks whose peak falls in the owned range
+    """
+    day, station, t1, t2, o1, o2 = unit
+    st = _worker["index"].read(station, t1, t2)
+    if len(st) == 0:
+        return day, PickList()
+    st.merge(fill_value=None)
+    st = handle_masked_arr(st)
+    config = _worker["config"]
+    picks, _ = pickChunk(_worker["pickers"], st, config)
+    picks = PickList([p for p in picks if o1 <= p.peak_time < o2])
+    if config["pick_amplitudes"] and len(picks):
+        amplitudes = measureAmplitudes(
+            st, picksToArray(picks), config, dayInventory(day))
+        for pick, amplitude in zip(picks, amplitudes):
+            pick.amplitude = amplitude
+    return day, picks
+
+
+def dedupPicks(picks, tolerance):
+    """Drop picks of the same trace and phase closer than tolerance
+
+    The pick with the highest peak value is kept, so the result does not
+    depend on the order shards finished in.
+
+    Returns:
+        seisbench.util.PickList: de-duplicated picks sorted by time
+    """
+    picks = sorted(picks, key=lambda p: (p.trace_id, p.phase, p.peak_time))
+    kept = []
+    for pick in picks:
+        last = kept[-1] if kept else None
+        if last and last.trace_id == pick.trace_id and \
+                last.phase == pick.phase and \
+                pick.peak_time - last.peak_time < tolerance:
+            if pick.peak_value > last.peak_value:
+                kept[-1] = pick
+            continue
+        kept.append(pick)
+    return PickList(sorted(kept))
+
+
+def shardUnits(config, st, et, stations):
+    """Split a day into (station, time-shard) work units"""
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    t1, t2 = utc(st), utc(et)
+    if len(config["searchWindow"]):
+        s, t = config["searchWindow"]
+        t1, t2 = max(t1, utc(s)), min(t2, utc(t))
+    units = []
+    o1 = t1
+    while o1 < t2:
+        o2 = min(o1 + config["shard_length"], t2)
+        for station in stations:
+            units.append((day, station,
+                          max(t1, o1 - config["shard_overlap"]),
+                          min(t2, o2 + config["shard_overlap"]),
+                          o1, o2))
+        o1 = o2
+    return units
+
+
+def runPickScheduler(config):
+    """Pick all days with a process pool over (station, time-shard) units
+
+    Shards of every day are queued at once, so workers move on to the
+    next day while the previous one is still finishing. Shard reads go
+    through the waveform archive index.
+    """
+    unsupported = [key for key in UNSUPPORTED if config[key]]
+    if unsupported:
+        raise ValueError(f"picker_scheduler does not support "
+                         f"{', '.join(unsupported)}, turn them off or set "
+                         f"picker_scheduler to false")
+    Path("results").mkdir(parents=True, exist_ok=True)
+    startTime = config["starttime"]
+    endTime = config["endtime"]
+    startDateRange = date_range(startTime, endTime-td(days=1), freq="1D")
+    endDateRange = date_range(startTime+td(days=1), endTime, freq="1D")
+    proj = getProjection(config)
+    index = WaveformIndex()
+    units, days = [], {}
+    for st, et in zip(startDateRange, endDateRange):
+        day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+        try:
+            table = loadStationTable(config, proj, st, et)
+        except Exception:
+            continue
+        index.update(glob(os.path.join("DB", day, "waveforms", "*.mseed")))
+        todo = stationsToPick(config, st, et)
+        stations = sorted(set([key.split(".")[1] for key in todo]) &
+                          set(table["station"]))
+        dayUnits = shardUnits(config, st, et, stations)
+        days[day] = {"st": st, "et": et, "remaining": len(dayUnits),
+                     "picks": PickList(), "todo": todo}
+        units += dayUnits
+        if not dayUnits:
+            saveDayPicks(PickList(), day, todo, final=True)
+            mergeDayPicks(st, et, config)
+    index.close()
+
+    tic = perf_counter()
+    with ProcessPoolExecutor(max_workers=config["picker_workers"],
+                             initializer=initPickWorker,
+                             initargs=(config,)) as pool:
+        futures = [pool.submit(pickUnit, unit) for unit in units]
+        desc = f"+++ Run {config['picker']} Picker on shards"
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc=desc, unit="shard"):
+            day, picks = future.result()
+            days[day]["picks"] += picks
+            days[day]["remaining"] -= 1
+            if days[day]["remaining"]:
+                continue
+            st, et = days[day]["st"], days[day]["et"]
+            picks = dedupPicks(days[day]["picks"], config["shard_dedup_tolerance"])
+            saveDayPicks(picks, day, days[day]["todo"], final=True)
+            mergeDayPicks(st, et, config)
+            days[day]["picks"] = None
+    elapsed = perf_counter() - tic
+    print(f"+++ Picked {len(units)} shards of {len(days)} day(s) in "
+          f"{elapsed:.1f} s with {config['picker_workers']} workers.")
@@ -0,0 +1,218 @@
+import json
+import os
+from glob import glob
+from hashlib import sha1
+from pathlib import Path
+
+from numpy import array, char, dtype, empty, fromfile, memmap, nan, unique
+from pandas import DataFrame, to_datetime
+
+# Fixed-size pick records, times in POSIX seconds
+PICK_DTYPE = dtype([
+    ("trace_id", "S24"),
+    ("start_time", "f8"),
+    ("end_time", "f8"),
+    ("peak_time", "f8"),
+    ("peak_value", "f4"),
+    ("phase", "S4"),
+    ("amplitude", "f4"),
+])
+
+# Configuration keys that change the picks of a station
+PICK_SETTINGS = [
+    "picker", "model", "model_update", "overlap", "batch_size",
+    "min_P_probability", "min_S_probability", "inference_backend",
+    "searchWindow", "preprocess_data", "picker_scheduler", "shard_length",
+    "shard_overlap", "shard_dedup_tolerance", "trigger_gating", "trigger_sta",
+    "trigger_lta", "trigger_on", "trigger_off", "trigger_freqmin",
+    "trigger_freqmax", "trigger_coincidence", "trigger_margin",
+    "pick_amplitudes", "amplitude_window", "amplitude_wood_anderson",
+    "ensemble_pickers", "ensemble_merge", "preprocess_float32",
+    "target_sampling_rate",
+]
+
+
+def pickFile(name):
+    return os.path.join("results", f"{name}.picks")
+
+
+def picksToArray(picks):
+    """Convert SeisBench picks to a structured array
+
+    Args:
+        picks (seisbench.util.PickList): picks
+
+    Returns:
+        numpy.ndarray: pick records with PICK_DTYPE
+    """
+    arr = empty(len(picks), dtype=PICK_DTYPE)
+    for i, pick in enumerate(picks):
+        arr[i] = (
+            pick.trace_id,
+            pick.start_time.timestamp if pick.start_time else nan,
+            pick.end_time.timestamp if pick.end_time else nan,
+            pick.peak_time.timestamp,
+            pick.peak_value,
+            pick.phase,
+            getattr(pick, "amplitude", nan))
+    return arr
+
+
+def asArray(picks):
+    return picks if getattr(picks, "dtype", None) == PICK_DTYPE else picksToArray(picks)
+
+
+def savePicks(picks, name):
+    """Write picks to results/<name>.picks, replacing the file"""
+    asArray(picks).tofile(pickFile(name))
+
+
+def appendPicks(picks, name):
+    """Append picks to results/<name>.picks"""
+    with open(pickFile(name), "ab") as f:
+        asArray(picks).tofile(f)
+
+
+def loadPicks(name, starttime=None, endtime=None):
+    """Read picks, optionally only those peaking inside a time range
+
+    Args:
+        name (str): pick file name without extension
+        starttime (UTCDateTime, optional): range start. Defaults to None.
+        endtime (UTCDateTime, optional): range end. Defaults to None.
+
+    Returns:
+        numpy.ndarray: pick records with PICK_DTYPE
+    """
+    path = pickFile(name)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return empty(0, dtype=PICK_DTYPE)
+    if starttime is None and endtime is None:
+        return fromfile(path, dtype=PICK_DTYPE)
+    arr = memmap(path, dtype=PICK_DTYPE, mode="r")
+    mask = True
+    if starttime is not None:
+        mask = mask & (arr["peak_time"] >= starttime.timestamp)
+    if endtime is not None:
+        mask = mask & (arr["peak_time"] < endtime.timestamp)
+    return arr[mask]
+
+
+def picksToFrame(picks):
+    """Build a pick DataFrame in one pass over the columns
+
+    Returns:
+        DataFrame: trace_id, peak_time (POSIX s), time (datetime),
+        peak_value, phase and amplitude columns
+    """
+    return DataFrame({
+        "trace_id": char.decode(picks["trace_id"]),
+        "peak_time": picks["peak_time"],
+        "time": to_datetime(picks["peak_time"], unit="s"),
+        "peak_value": picks["peak_value"],
+        "phase": char.decode(picks["phase"]),
+        "amplitude": picks["amplitude"],
+    })
+
+
+def stationPickDir(day):
+    return os.path.join("results", "picks", day)
+
+
+def fileHash(paths):
+    """Content hash of a set of files, independent of their order"""
+    h = sha1()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def settingsHash(config):
+    settings = {key: config[key] for key in PICK_SETTINGS}
+    return sha1(json.dumps(
+        settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def readSidecar(day, key):
+    path = os.path.join(stationPickDir(day), f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def saveStationPicks(picks, day, key, hashes):
+    """Write the picks of one station-day and its input hashes
+
+    The sidecar is written last, so a station interrupted half way is
+    picked again on the next run.
+
+    Args:
+        picks (PickList or numpy.ndarray): picks of the station
+        day (str): day key
+        key (str): NET.STA
+        hashes (dict): waveform and picker settings hashes
+    """
+    Path(stationPickDir(day)).mkdir(parents=True, exist_ok=True)
+    savePicks(picks, os.path.join("picks", day, key))
+    path = os.path.join(stationPickDir(day), f"{key}.json")
+    with open(f"{path}.part", "w") as f:
+        json.dump(hashes, f)
+    os.replace(f"{path}.part", path)
+
+
+def removeStationPicks(day, keep):
+    """Delete artifacts of stations that are no longer part of the input"""
+    for path in glob(os.path.join(stationPickDir(day), "*.*.json")):
+        key = os.path.basename(path)[:-5]
+        if key not in keep:
+            os.remove(path)
+            if os.path.exists(pickFile(os.path.join("picks", day, key))):
+                os.remove(pickFile(os.path.join("picks", day, key)))
+
+
+def splitByStation(picks):
+    """Group picks by NET.STA
+
+    Returns:
+        dict: pick arrays per NET.STA
+    """
+    picks = asArray(picks)
+    keys = array([".".join(trace_id.split(".")[:2])
+                  for trace_id in char.decode(picks["trace_id"])])
+    return {key: picks[keys == key] for key in unique(keys)}
+
+
+def mergeStationPicks(day):
+    """Rebuild results/<day>.picks from the station-day artifacts
+
+    Picks of newly added stations are appended to the day file, it is
+    only rewritten when a station changed or disappeared.
+
+    Returns:
+        bool: True if the day file changed
+    """
+    current = {}
+    for path in sorted(glob(os.path.join(stationPickDir(day), "*.*.json"))):
+        with open(path) as f:
+            current[os.path.basename(path)[:-5]] = json.load(f)
+    mergePath = os.path.join(stationPickDir(day), "merge.json")
+    previous = {}
+    if os.path.exists(mergePath) and os.path.exists(pickFile(day)):
+        with open(mergePath) as f:
+            previous = json.load(f)
+    if previous == current and os.path.exists(pickFile(day)):
+        return False
+    if previous and all([current.get(k) == v for k, v in previous.items()]):
+        new = [key for key in current if key not in previous]
+    else:
+        open(pickFile(day), "wb").close()
+        new = list(current)
+    for key in new:
+        appendPicks(loadPicks(os.path.join("picks", day, key)), day)
+    Path(stationPickDir(day)).mkdir(parents=True, exist_ok=True)
+    with open(mergePath, "w") as f:
+        json.dump(current, f)
+    return True
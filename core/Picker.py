@@ -4,14 +4,224 @@ from pathlib import Path
 from glob import glob
 
 import seisbench.models as sbm
-from obspy import read
+from obspy import read, read_inventory
 from pandas import date_range
 from obspy.core.stream import Stream
 
-from core.PrepareData import (saveModel, loadModel, prepareWaveforms)
-from core.Extra import divide_chunks
-from torch import cuda
+from core.Amplitude import measureAmplitudes
+from core.ArrayArchive import archiveStations
+from core.AnnotationStore import (loadAnnotations, picksFromAnnotations,
+                                  saveAnnotations)
+from core.PrepareData import prepareWaveforms
+from core.PickStore import (fileHash, mergeStationPicks, picksToArray,
+                            readSidecar, removeStationPicks,
+                            saveStationPicks, settingsHash, splitByStation)
+from core.Ensemble import memberConfigs, mergeAnnotations
+from core.InferenceClient import remotePicker
+from core.FastInference import matchPicks, optimizePicker, parityCheck
+from core.Extra import budget_chunks, peakMemory, resetPeakMemory
+from core.Tables import FORMATS
+from core.Trigger import gateStream, networkWindows
+from torch import cuda, no_grad, zeros
 from seisbench.util import PickList
+from time import perf_counter
+
+# Rough working memory per input sample: the float64 copy SeisBench
+# preprocesses plus the float32 window and annotation buffers
+BYTES_PER_SAMPLE = 12
+
+_pickers = {}
+_baselines = {}
+timings = {"load": 0.0, "warmup": 0.0, "inference": 0.0}
+
+
+def getPicker(config):
+    """Load the picker model once per process and reuse it
+
+    Args:
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        seisbench.models.WaveformModel: the picker model
+    """
+    key = (config["picker"], config["model"], config["model_update"])
+    if key not in _pickers:
+        tic = perf_counter()
+        p_nam, m_nam, m_upd = key
+        if config["inference_server"]:
+            picker = remotePicker(config)
+        else:
+            picker = getattr(sbm, p_nam).from_pretrained(m_nam, update=m_upd)
+            if cuda.is_available():
+                picker.cuda()
+            if config["inference_backend"] != "fp32":
+                _baselines[key] = picker
+                picker = optimizePicker(picker, config)
+        timings["load"] += perf_counter() - tic
+        if config["picker_warmup"]:
+            tic = perf_counter()
+            warmUpPicker(picker)
+            timings["warmup"] += perf_counter() - tic
+        _pickers[key] = picker
+    return _pickers[key]
+
+
+def warmUpPicker(picker):
+    """Run one dummy window so later batches do not pay first-call costs"""
+    x = zeros((1, len(picker.component_order), picker.in_samples),
+              device=picker.device)
+    with no_grad():
+        picker(x)
+
+
+def pickerParallelism(config):
+    return config["picker_parallelism"] or os.cpu_count() - 2
+
+
+def pickStream(picker, stream, config):
+    """Apply the picker on a stream
+
+    Returns:
+        seisbench.util.PickList: picks of the stream
+    """
+    tic = perf_counter()
+    picks = picker.classify(stream,
+                            overlap=config["overlap"],
+                            batch_size=config["batch_size"],
+                            P_threshold=config["min_P_probability"],
+                            S_threshold=config["min_S_probability"],
+                            parallelism=pickerParallelism(config)).picks
+    timings["inference"] += perf_counter() - tic
+    return picks
+
+
+def annotate(picker, stream, config):
+    """Apply the picker on a stream
+
+    Returns:
+        obspy.Stream: probability traces of the stream
+    """
+    tic = perf_counter()
+    annotations = picker.annotate(stream,
+                                  overlap=config["overlap"],
+                                  batch_size=config["batch_size"],
+                                  parallelism=pickerParallelism(config))
+    timings["inference"] += perf_counter() - tic
+    return annotations
+
+
+def annotateStream(picker, stream, config):
+    """Apply the picker on a stream, keeping the probability traces
+
+    Returns:
+        tuple: picks and annotation stream
+    """
+    annotations = annotate(picker, stream, config)
+    return picksFromAnnotations(annotations, config), annotations
+
+
+def pickChunk(pickers, stream, config):
+    """Pick a stream with one picker or an ensemble of pickers
+
+    Ensemble members annotate the same in-memory stream, their P/S
+    probabilities are merged with ensemble_merge before pick extraction.
+
+    Returns:
+        tuple: picks and annotation stream, None if annotations were not
+        kept
+    """
+    if len(pickers) > 1:
+        annotations = mergeAnnotations(
+            [annotate(picker, stream, config) for picker in pickers],
+            config["ensemble_merge"])
+        return picksFromAnnotations(annotations, config), annotations
+    if config["store_annotations"]:
+        return annotateStream(pickers[0], stream, config)
+    return pickStream(pickers[0], stream, config), None
+
+
+def repickFromAnnotations(config, st, et):
+    """Re-threshold stored annotations of a day, no model call involved"""
+    print("+++ Extracting picks from stored annotations ...")
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    inputs = stationInputs(config, st, et)
+    picks = splitByStation(
+        picksFromAnnotations(loadAnnotations(st, et), config))
+    # No waveforms are read here, so the picks carry no amplitudes and a
+    # later run with pick_amplitudes must not take them as up to date
+    settings = settingsHash({**config, "pick_amplitudes": False})
+    for key in set(inputs) | set(picks):
+        hashes = {"data": fileHash(inputs.get(key, [])), "settings": settings}
+        saveStationPicks(picks.get(key, PickList()), day, key, hashes)
+
+
+def stationInputs(config, st, et):
+    """Get the input waveform files of each NET.STA of a day
+
+    Returns:
+        dict: input file paths per NET.STA
+    """
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    inputs = {}
+    if config["preprocess_data"]:
+        for f in glob(os.path.join("DB", day, "waveforms", "*.mseed")):
+            net, sta = os.path.basename(f).split(".")[:2]
+            if net in config["networks"]:
+                inputs.setdefault(f"{net}.{sta}", []).append(f)
+    else:
+        for f in glob(os.path.join("tmp", "*.mseed")):
+            stats = read(f, headonly=True)[0].stats
+            inputs.setdefault(f"{stats.network}.{stats.station}", []).append(f)
+    return inputs
+
+
+def stationsToPick(config, st, et):
+    """Find the stations of a day whose waveforms or picker settings changed
+
+    Artifacts of stations that left the input are removed.
+
+    Returns:
+        dict: waveform and settings hashes per NET.STA to pick
+    """
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    inputs = stationInputs(config, st, et)
+    removeStationPicks(day, inputs)
+    settings = settingsHash(config)
+    todo = {}
+    for key, files in sorted(inputs.items()):
+        hashes = {"data": fileHash(files), "settings": settings}
+        if config["repick_data"] or readSidecar(day, key) != hashes:
+            todo[key] = hashes
+    print(f"+++ {len(todo)}/{len(inputs)} station(s) to pick, "
+          f"the rest is unchanged")
+    return todo
+
+
+def saveDayPicks(picks, day, todo, final=False):
+    """Write picks of the stations in todo and remove them from it
+
+    With final set, stations that got no picks are written empty.
+    """
+    for key, stationPicks in splitByStation(picks).items():
+        if key in todo:
+            saveStationPicks(stationPicks, day, key, todo.pop(key))
+    if final:
+        for key in list(todo):
+            saveStationPicks(PickList(), day, key, todo.pop(key))
+
+
+def countSamples(s):
+    """Count the samples of a stream or miniSEED file without decoding it"""
+    st = s if isinstance(s, Stream) else read(s, headonly=True)
+    return sum([tr.stats.npts for tr in st])
+
+
+def chunkBudget(config):
+    """Get the sample budget of a picker chunk from the configuration"""
+    budget = config["chunk_max_samples"]
+    if config["chunk_max_memory_mb"]:
+        budget = min(budget, config["chunk_max_memory_mb"] * 1e6 / BYTES_PER_SAMPLE)
+    return budget
 
 
 def runPicker(config):
@@ -23,55 +233,113 @@ def runPicker(config):
     endDateRange = date_range(startTime+td(days=1), endTime, freq="1D")
     for st, et in zip(startDateRange, endDateRange):
         print(f"+++ Run {config['picker']} Picker on period: {st} - {et}")
-        dataExists = prepareWaveforms(st, et, config)
-        if not dataExists:
-            continue
-        chunksData = glob(os.path.join("tmp", "*.mseed"))
-        for c, chunkData in enumerate(divide_chunks(chunksData, 10)):
-            print(f"+++ Applying SeisBench on chunk {c+1} ...")
-            pick_outname = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}_{c}"
-            if not config["repick_data"] and os.path.exists(
-                    os.path.join("results", f"{pick_outname}.jlib")):
-                continue
-            stream = Stream()
-            for s in chunkData:
-                stream += read(s)
-            min_p_prob = config["min_P_probability"]
-            min_s_prob = config["min_S_probability"]
-            batch_size = config["batch_size"]
-            overlap = config["overlap"]
-            ncpu = os.cpu_count() - 2
-            p_nam = config["picker"]
-            m_nam = config["model"]
-            m_upd = config["model_update"]
-            picker = sbm.PhaseNet.from_pretrained("original")
-            picker = eval(f"sbm.{p_nam}.from_pretrained('{m_nam}', update={m_upd})")
-            if cuda.is_available():
-                picker.cuda()
-            picks = picker.classify(stream,
-                                    overlap=overlap,
-                                    batch_size=batch_size,
-                                    P_threshold=min_p_prob,
-                                    S_threshold=min_s_prob,
-                                    parallelism=ncpu).picks
-            if config["repick_data"] and os.path.exists(
-                    os.path.join("results", f"{pick_outname}.jlib")):
-                os.remove(os.path.join("results", f"{pick_outname}.jlib"))
-
-            if len(picks):
-                saveModel(picks, pick_outname)
-        for f in [f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.jlib",
-                  f"picks_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv",
-                  f"catalog_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv",
-                  f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.out"]:
-            if os.path.exists(os.path.join("results", f)):
-                os.remove(os.path.join("results", f))
-        picksList = PickList()
-        picks_list = glob(os.path.join(
-            "results", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}_*.jlib"))
-        picks_list = sorted(picks_list, key=lambda x: int(
-            x.split("_")[-1].split(".")[0]))
-        for picks in picks_list:
-            picks = loadModel(picks)
-            picksList += picks
-        saveModel(picksList, f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}")
+        if config["repick_from_annotations"]:
+            repickFromAnnotations(config, st, et)
+        else:
+            todo = stationsToPick(config, st, et)
+            if todo:
+                pickStations(config, st, et, todo)
+        mergeDayPicks(st, et, config)
+    print(f"+++ Picker timings: model loading {timings['load']:.1f} s, "
+          f"warm-up {timings['warmup']:.1f} s, "
+          f"inference {timings['inference']:.1f} s")
+
+
+def pickStations(config, st, et, todo):
+    """Pick the given stations of a day in memory-bounded chunks
+
+    Args:
+        config (dict): a dictionary contains main configuration
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+        todo (dict): waveform and settings hashes per NET.STA
+    """
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    stations = set([key.split(".")[1] for key in todo])
+    if config["array_archive"]:
+        chunksData = archiveStations(config, st, et, stations)
+    else:
+        dataExists = prepareWaveforms(st, et, config, only=stations)
+        if dataExists is None:
+            return
+        if isinstance(dataExists, list):
+            chunksData = dataExists
+        else:
+            chunksData = [f for f in glob(os.path.join("tmp", "*.mseed"))
+                          if os.path.basename(f)[:-6] in stations]
+    inventory = None
+    if config["pick_amplitudes"]:
+        try:
+            inventory = read_inventory(os.path.join("DB", day, "stations", "*.xml"))
+        except Exception:
+            pass
+    windows = None
+    if config["trigger_gating"]:
+        # Coincidence needs the whole network, not one budget chunk
+        minLength = max([2 * p.in_samples / p.sampling_rate for p in
+                         [getPicker(m) for m in memberConfigs(config)]])
+        windows = networkWindows(
+            (s if isinstance(s, Stream) else read(s) for s in chunksData),
+            config, minLength)
+        print(f"+++ STA/LTA coincidence found {len(windows)} window(s) "
+              f"on {len(chunksData)} station(s)")
+    sizes = [countSamples(s) for s in chunksData]
+    chunks = list(budget_chunks(
+        list(zip(chunksData, sizes)), sizes, chunkBudget(config)))
+    for c, chunk in enumerate(chunks):
+        chunkData = [s for s, _ in chunk]
+        nSamples = sum([size for _, size in chunk])
+        print(f"+++ Applying SeisBench on chunk {c+1}/{len(chunks)} "
+              f"({len(chunkData)} stations, {nSamples/1e6:.1f} M samples) ...")
+        stream = Stream()
+        for s in chunkData:
+            stream += s if isinstance(s, Stream) else read(s)
+        pickers = []
+        for member in memberConfigs(config):
+            picker = getPicker(member)
+            key = (member["picker"], member["model"], member["model_update"])
+            if key in _baselines:
+                # Checked once, then the fp32 copy is released
+                if config["inference_parity_check"]:
+                    parityCheck(_baselines[key], picker, stream, member)
+                del _baselines[key]
+            pickers.append(picker)
+        resetPeakMemory()
+        fullStream = stream
+        if config["trigger_gating"]:
+            stream, skipped = gateStream(stream, windows)
+            print(f"+++ STA/LTA gating skips {skipped*1e2:.1f}% of chunk {c+1}")
+        annotations = None
+        if len(stream):
+            picks, annotations = pickChunk(pickers, stream, config)
+        else:
+            picks = PickList()
+        if config["store_annotations"] and annotations is not None:
+            saveAnnotations(annotations, st, et)
+        if config["trigger_gating"] and config["trigger_compare"]:
+            fullPicks, _ = pickChunk(pickers, fullStream, config)
+            nMatched, _, _ = matchPicks(fullPicks, picks)
+            print(f"+++ Gated picking kept {nMatched}/{len(fullPicks)} "
+                  f"picks of full inference")
+        picks = picksToArray(picks)
+        if config["pick_amplitudes"]:
+            picks["amplitude"] = measureAmplitudes(
+                fullStream, picks, config, inventory)
+        print(f"+++ Chunk {c+1} peak memory: {peakMemory():.0f} MB")
+        saveDayPicks(picks, day, todo)
+    saveDayPicks(PickList(), day, todo, final=True)
+
+
+def mergeDayPicks(st, et, config):
+    """Bring the day pick file up to date with the station-day artifacts
+
+    Association results of the day are removed when its picks changed,
+    unless incremental association keeps building on them.
+    """
+    day = f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}"
+    if not mergeStationPicks(day) or config["association_incremental"]:
+        return
+    for f in [f"picks_{day}.{fmt}" for fmt in FORMATS] + \
+            [f"catalog_{day}.{fmt}" for fmt in FORMATS] + [f"{day}.out"]:
+        if os.path.exists(os.path.join("results", f)):
+            os.remove(os.path.join("results", f))
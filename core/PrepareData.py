@@ -1,27 +1,28 @@
 #!/usr/bin/env python3
 
-from obspy import read, read_inventory
+from obspy import Stream, Trace, read, read_inventory
 from obspy import UTCDateTime as utc
 import os
 from pathlib import Path
 from tqdm import tqdm
-from pandas import DataFrame, Series
+from pandas import DataFrame
 from glob import glob
 from core.Extra import handle_masked_arr
+from core.Projection import projectColumns
+from core.WaveformIndex import WaveformIndex
 from obspy.core.inventory.inventory import Inventory
 import joblib
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from numpy import ascontiguousarray, float32, ndarray
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                as_completed, wait)
 
 
-def saveModel(model, pick_outname):
-    joblib.dump(model, os.path.join("results", f"{pick_outname}.jlib"))
+_inventoryCache = {}
 
 
-def loadModel(pick_filename):
-    model = joblib.load(pick_filename)
-    return model
-
-
-def prepareWaveforms(starttime, endtime, config):
+def prepareWaveforms(starttime, endtime, config, only=None):
     path = Path("tmp")
     path.mkdir(parents=True, exist_ok=True)
 
@@ -52,52 +53,255 @@ def prepareWaveforms(starttime, endtime, config):
     stations = sorted(set([
         s.split(".")[1] for s in inv.get_contents()["channels"]
     ]))
+    if only is not None:
+        stations = [s for s in stations if s in only]
+
+    # Index the day once, workers only query it
+    if config["waveform_index"]:
+        index = WaveformIndex()
+        index.update(glob(os.path.join(
+            "DB",
+            f"{starttime.strftime('%Y%m%d')}_{endtime.strftime('%Y%m%d')}",
+            "waveforms",
+            "*.mseed")))
+        index.close()
+
+    desc = "+++ Preparing raw data"
+    lines, streams = {}, []
+    if config["preprocess_workers"] > 1:
+        pbar = tqdm(total=len(stations), desc=desc, unit="station")
+        maxInflight = max(
+            config["preprocess_max_inflight"], config["preprocess_workers"])
+        with ProcessPoolExecutor(
+                max_workers=config["preprocess_workers"]) as pool:
+            futures = {}
+            for station in stations:
+                if len(futures) >= maxInflight:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        line, shared = future.result()
+                        lines[futures.pop(future)] = line
+                        streams.append(streamFromSharedMemory(shared))
+                        pbar.update()
+                futures[pool.submit(
+                    prepareStationShared, station, starttime, endtime, config)] = station
+            for future in as_completed(futures):
+                line, shared = future.result()
+                lines[futures[future]] = line
+                streams.append(streamFromSharedMemory(shared))
+                pbar.update()
+        pbar.close()
+    else:
+        for station in tqdm(stations, desc=desc, unit="station"):
+            lines[station], st = prepareStation(
+                station, starttime, endtime, config)
+            streams.append(st)
 
+    # Write in station order whatever the completion order was
     with open(os.path.join("tmp", "mseed.csv"), "w") as fp:
         fp.write("fname,E,N,Z\n")
-        desc = "+++ Preparing raw data"
-        for station in tqdm(stations, desc=desc, unit="station"):
-            st = read(os.path.join(
-                "DB",
-                f"{starttime.strftime('%Y%m%d')}_{endtime.strftime('%Y%m%d')}",
-                "waveforms",
-                f"??.{station}.*.???__{starttime.strftime('%Y%m%d')}T000000Z__{endtime.strftime('%Y%m%d')}T000000Z.mseed"),
-                format="MSEED", check_compression=False)
-            st.merge(fill_value=None)
-            st = handle_masked_arr(st)
-            if len(config["searchWindow"]):
-                s, t = config["searchWindow"]
-                st = st.slice(utc(s), utc(t))
-            if len(st):
-                st = st.slice(utc(starttime), utc(endtime))
-                st.write(os.path.join("tmp", f"{station}.mseed"))
-                sta = st[0].stats.station
-                chn = st[0].stats.channel[:-1]
-                fp.write(
-                    f"{sta}.mseed,{chn}E,{chn}N,{chn}Z\n")
+        for station in stations:
+            if lines[station]:
+                fp.write(lines[station])
+
+    # Hand the traces to the picker without the tmp round trip
+    if config["pipeline_in_memory"]:
+        streams = [st for st in streams if st is not None]
+        return sorted(streams, key=lambda st: st[0].stats.station)
     return True
 
 
-def prepareInventory(config, proj, st, et, onsite=False):
-    stationxml = os.path.join(
+def readStation(station, starttime, endtime, config):
+    if config["waveform_index"]:
+        t1, t2 = utc(starttime), utc(endtime)
+        if len(config["searchWindow"]):
+            s, t = config["searchWindow"]
+            t1, t2 = max(t1, utc(s)), min(t2, utc(t))
+        index = WaveformIndex()
+        st = index.read(station, t1, t2)
+        index.close()
+        return st
+    return read(os.path.join(
         "DB",
-        f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}",
-        "stations",
-        "*.xml")
-    inv = read_inventory(stationxml)
-    station_df = []
-    for net in inv:
+        f"{starttime.strftime('%Y%m%d')}_{endtime.strftime('%Y%m%d')}",
+        "waveforms",
+        f"??.{station}.*.???__{starttime.strftime('%Y%m%d')}T000000Z__{endtime.strftime('%Y%m%d')}T000000Z.mseed"),
+        format="MSEED", check_compression=False)
+
+
+def prepareStation(station, starttime, endtime, config):
+    """Read, merge and slice one station and write it to tmp
+
+    Args:
+        station (str): station code
+        starttime (Timestamp): start of the day
+        endtime (Timestamp): end of the day
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        tuple: the station line of tmp/mseed.csv and the prepared stream if
+        pipeline_in_memory is set, None for both if no data left
+    """
+    st = readStation(station, starttime, endtime, config)
+    if len(config["searchWindow"]):
+        s, t = config["searchWindow"]
+        st = st.slice(utc(s), utc(t))
+    st = st.slice(utc(starttime), utc(endtime))
+    if config["preprocess_float32"]:
+        st = preprocessSegments(st, config)
+    else:
+        st.merge(fill_value=None)
+        st = handle_masked_arr(st)
+    if len(st):
+        if not config["pipeline_in_memory"] or config["keep_tmp_files"]:
+            st.write(os.path.join("tmp", f"{station}.mseed"))
+        sta = st[0].stats.station
+        chn = st[0].stats.channel[:-1]
+        line = f"{sta}.mseed,{chn}E,{chn}N,{chn}Z\n"
+        return line, st if config["pipeline_in_memory"] else None
+    return None, None
+
+
+def preprocessSegments(st, config):
+    """Gap-aware float32 preprocessing of a station stream
+
+    Traces are merged only where they are contiguous, so gaps stay
+    between segments instead of being held in masked arrays. Each segment
+    is cast to float32 and brought to target_sampling_rate once, by
+    decimation with its anti-alias filter when the ratio is an integer and
+    by low-pass and resampling otherwise.
+
+    Args:
+        st (obspy.Stream): raw station stream
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        obspy.Stream: float32 segments at the target sampling rate
+    """
+    st.merge(method=-1)
+    sr = config["target_sampling_rate"]
+    for tr in st:
+        tr.data = tr.data.astype(float32, copy=False)
+        if not sr or tr.stats.sampling_rate == sr:
+            continue
+        ratio = tr.stats.sampling_rate / sr
+        if ratio > 1 and ratio.is_integer() and ratio <= 16:
+            tr.decimate(int(ratio))
+        else:
+            if ratio > 1:
+                tr.filter("lowpass", freq=0.45 * sr, zerophase=True)
+            tr.resample(sr)
+        tr.data = tr.data.astype(float32, copy=False)
+    return st
+
+
+def prepareStationShared(station, starttime, endtime, config):
+    line, st = prepareStation(station, starttime, endtime, config)
+    return line, streamToSharedMemory(st)
+
+
+def streamToSharedMemory(st):
+    """Copy trace data into shared memory blocks
+
+    Args:
+        st (obspy.Stream): a stream, or None
+
+    Returns:
+        list: a list of (stats, block name, dtype, shape) per trace
+    """
+    if st is None:
+        return None
+    shared = []
+    for tr in st:
+        data = ascontiguousarray(tr.data)
+        shm = SharedMemory(create=True, size=max(data.nbytes, 1))
+        ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+        # The parent unlinks the block after copying it
+        resource_tracker.unregister(shm._name, "shared_memory")
+        shared.append((tr.stats, shm.name, data.dtype.str, data.shape))
+        shm.close()
+    return shared
+
+
+def streamFromSharedMemory(shared):
+    if shared is None:
+        return None
+    st = Stream()
+    for stats, name, dtype, shape in shared:
+        shm = SharedMemory(name=name)
+        data = ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+        shm.close()
+        shm.unlink()
+        st.append(Trace(data=data, header=stats))
+    return st
+
+
+def loadStationTable(config, proj, st, et):
+    """Load the station table of a day, parsing StationXML only once
+
+    The table is kept in memory for the run and in DB/<day>/inventory.jlib
+    across runs, keyed by the StationXML paths and modification times and
+    by the projection center.
+
+    Args:
+        config (dict): a dictionary contains main configuration
+        proj (pyproj.Proj): projection used for x/y coordinates
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+
+    Returns:
+        DataFrame: one row per station with codes, location codes,
+        coordinates, elevation and projected x/y
+    """
+    dayPath = os.path.join(
+        "DB", f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}")
+    stationxmls = sorted(glob(os.path.join(dayPath, "stations", "*.xml")))
+    key = (tuple([(f, os.path.getmtime(f)) for f in stationxmls]),
+           tuple(config["center"]))
+    if key in _inventoryCache:
+        return _inventoryCache[key].copy()
+    cacheFile = os.path.join(dayPath, "inventory.jlib")
+    if os.path.exists(cacheFile):
+        cache = joblib.load(cacheFile)
+        if cache["key"] == key:
+            _inventoryCache[key] = cache["table"]
+            return cache["table"].copy()
+    inv = read_inventory(os.path.join(dayPath, "stations", "*.xml"))
+    table = []
+    for n, net in enumerate(inv):
         for sta in net:
-            station_df.append({
-                "id": f"{net.code}.{sta.code}.",
+            locations = set([cha.location_code for cha in sta] + [""])
+            table.append({
+                "network": net.code,
+                "station": sta.code,
+                "locations": ",".join(sorted(locations)),
+                "network_index": n,
                 "longitude": sta.longitude,
                 "latitude": sta.latitude,
                 "elevation(m)": sta.elevation,
-                "unit": "m/s",
-                "component": "E,N,Z",
             })
-            break
-    station_df = DataFrame(station_df)
+    table = DataFrame(table)
+    table = projectColumns(
+        proj, table, ["longitude", "latitude"], ["x(km)", "y(km)"])
+    joblib.dump({"key": key, "table": table}, cacheFile)
+    _inventoryCache[key] = table
+    return table.copy()
+
+
+def prepareInventory(config, proj, st, et, onsite=False):
+    table = loadStationTable(config, proj, st, et)
+    # First station of each network entry, as read_inventory returns them
+    table = table.drop_duplicates(subset=["network_index"])
+    station_df = DataFrame({
+        "id": table["network"] + "." + table["station"] + ".",
+        "longitude": table["longitude"],
+        "latitude": table["latitude"],
+        "elevation(m)": table["elevation(m)"],
+        "unit": "m/s",
+        "component": "E,N,Z",
+        "x(km)": table["x(km)"],
+        "y(km)": table["y(km)"],
+    })
     if onsite:
         cx1 = station_df["longitude"] >= config["xlim_degree"][0]
         cx2 = station_df["longitude"] < config["xlim_degree"][1]
@@ -106,11 +310,7 @@ def prepareInventory(config, proj, st, et, onsite=False):
         c = (cx1) & (cx2) & (cy1) & (cy2)
         station_df = station_df[c]
     station_df.reset_index(inplace=True, drop=True)
-    station_df[["x(km)", "y(km)"]] = station_df.apply(
-        lambda x: Series(
-            proj(longitude=x.longitude, latitude=x.latitude)),
-        axis=1)
-    station_df["z(km)"] = station_df["elevation(m)"].apply(lambda x: -x*1e-3)
+    station_df["z(km)"] = -station_df["elevation(m)"]*1e-3
     station_dict = {station: (x, y) for station, x, y in zip(
         station_df["id"], station_df["x(km)"], station_df["y(km)"])}
     return station_df, station_dict
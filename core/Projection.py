@@ -0,0 +1,43 @@
+from pyproj import Proj
+
+_projections = {}
+
+
+def getProjection(config):
+    """Get the local projection centered on config["center"]
+
+    The projection is built once per center and shared by all modules.
+
+    Args:
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        pyproj.Proj: a stereographic projection in km
+    """
+    center = tuple(config["center"])
+    if center not in _projections:
+        _projections[center] = Proj(
+            f"+proj=sterea +lon_0={center[0]} +lat_0={center[1]} +units=km")
+    return _projections[center]
+
+
+def projectColumns(proj, df, inColumns, outColumns, inverse=False):
+    """Project two columns of a DataFrame in one vectorized call
+
+    Args:
+        proj (pyproj.Proj): projection
+        df (DataFrame): input DataFrame, modified in place
+        inColumns (list): names of the longitude/x and latitude/y columns
+        outColumns (list): names of the output columns
+        inverse (bool, optional): from x/y to longitude/latitude.
+        Defaults to False.
+
+    Returns:
+        DataFrame: the input DataFrame with the output columns set
+    """
+    a, b = proj(df[inColumns[0]].values,
+                df[inColumns[1]].values,
+                inverse=inverse)
+    df[outColumns[0]] = a
+    df[outColumns[1]] = b
+    return df
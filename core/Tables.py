@@ -0,0 +1,78 @@
+import os
+
+from pandas import (Timestamp, read_csv, read_feather, read_parquet,
+                    to_datetime)
+from pandas.api.types import is_numeric_dtype
+
+FORMATS = ["csv", "parquet", "feather"]
+
+
+def tablePath(kind, st, et, fmt):
+    return os.path.join(
+        "results",
+        f"{kind}_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.{fmt}")
+
+
+def toSeconds(times):
+    """POSIX seconds of a numeric or date-like time column"""
+    if is_numeric_dtype(times):
+        return times.astype(float)
+    return (to_datetime(times, format="ISO8601") -
+            Timestamp(0)).dt.total_seconds()
+
+
+def typedTable(df):
+    """Native timestamps for the time column and categories for codes"""
+    df = df.reset_index(drop=True)
+    if is_numeric_dtype(df["time"]):
+        df["time"] = to_datetime(df["time"], unit="s")
+    else:
+        df["time"] = to_datetime(df["time"], format="ISO8601")
+    for column in ["station", "phase"]:
+        if column in df:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def writeTable(df, kind, st, et, config):
+    """Write a catalog or picks table of a day
+
+    Parquet and Feather tables keep native timestamps and categorical
+    station/phase columns, the tab-separated CSV is written when it is
+    the table format or table_csv_export is set.
+
+    Args:
+        df (DataFrame): the table
+        kind (str): "catalog" or "picks"
+        st (Timestamp): start of the day
+        et (Timestamp): end of the day
+        config (dict): a dictionary contains main configuration
+    """
+    fmt = config["table_format"]
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown table format '{fmt}', use one of {FORMATS}")
+    if fmt == "parquet":
+        typedTable(df).to_parquet(tablePath(kind, st, et, fmt), index=False)
+    elif fmt == "feather":
+        typedTable(df).to_feather(tablePath(kind, st, et, fmt))
+    if fmt == "csv" or config["table_csv_export"]:
+        with open(tablePath(kind, st, et, "csv"), "w") as fp:
+            df.to_csv(
+                fp,
+                sep="\t",
+                index=False,
+                float_format="%.3f" if kind == "catalog" else None,
+                date_format='%Y-%m-%dT%H:%M:%S.%f')
+
+
+def readTable(kind, st, et, config):
+    """Read a catalog or picks table of a day, None if it does not exist"""
+    fmt = config["table_format"]
+    path = tablePath(kind, st, et, fmt)
+    if not os.path.exists(path):
+        return None
+    if fmt == "parquet":
+        return read_parquet(path)
+    if fmt == "feather":
+        return read_feather(path)
+    return read_csv(path, sep="\t")
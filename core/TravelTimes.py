@@ -0,0 +1,112 @@
+import json
+import os
+from contextlib import contextmanager
+from hashlib import sha1
+from pathlib import Path
+from tempfile import mkstemp
+
+import gamma.seismic_ops
+import gamma.utils
+import joblib
+import pyocto
+from numpy import array
+from obspy.geodetics.base import degrees2kilometers as d2k
+from pandas import DataFrame
+
+_velocityModels = {}
+_eikonals = {}
+
+
+def tableDir():
+    path = Path(os.path.join("results", "traveltimes"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def tableHash(*items):
+    """Hash of velocity model, grid spacing and extent settings"""
+    return sha1(json.dumps(
+        items, sort_keys=True,
+        default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)
+    ).encode()).hexdigest()[:16]
+
+
+def tempPath(path):
+    """Unique temporary file next to path, for os.replace when complete"""
+    fd, tmp = mkstemp(dir=os.path.dirname(path),
+                      prefix=f"{os.path.basename(path)}.", suffix=".part")
+    os.close(fd)
+    return tmp
+
+
+def pyoctoVelocityModel(config):
+    """Get the PyOcto 1D velocity model, building its table only once
+
+    The travel-time table is written to results/traveltimes/vm_<hash>.dat
+    and reused while the velocity model, spacing and extent stay the same.
+
+    Args:
+        config (dict): a dictionary contains main configuration
+
+    Returns:
+        pyocto.VelocityModel1D: the velocity model
+    """
+    vp = array(config["vp"])
+    vs = vp/config["vp_vs_ratio"]
+    z = array(config["zz"])
+    spacing = 1.0
+    maxradius = d2k(config["maxradius"])
+    maxdepth = config["zlim_degree"][1]
+    key = tableHash(vp, vs, z, spacing, maxradius, maxdepth)
+    path = os.path.join(tableDir(), f"vm_{key}.dat")
+    if not os.path.exists(path):
+        model = DataFrame({"vp": vp, "vs": vs, "depth": z})
+        tmp = tempPath(path)
+        pyocto.VelocityModel1D.create_model(
+            model, spacing, maxradius, maxdepth, tmp)
+        os.replace(tmp, path)
+    memo = (key, config["tolerance"], config["association_cutoff_distance"])
+    if memo not in _velocityModels:
+        _velocityModels[memo] = pyocto.VelocityModel1D(
+            path,
+            config["tolerance"],
+            config["association_cutoff_distance"],
+            surface_p_velocity=vp[0],
+            surface_s_velocity=vs[0])
+    return _velocityModels[memo]
+
+
+def cachedEikonal(eikonal):
+    """Cached version of GaMMA's initialize_eikonal
+
+    Solved tables are kept in memory and in
+    results/traveltimes/eikonal_<hash>.jlib.
+    """
+    key = tableHash(eikonal["vel"], eikonal["h"], eikonal["xlim"],
+                    eikonal["ylim"], eikonal["zlim"])
+    if key not in _eikonals:
+        path = os.path.join(tableDir(), f"eikonal_{key}.jlib")
+        if os.path.exists(path):
+            _eikonals[key] = joblib.load(path)
+        else:
+            _eikonals[key] = gamma.seismic_ops.initialize_eikonal(eikonal)
+            tmp = tempPath(path)
+            joblib.dump(_eikonals[key], tmp)
+            os.replace(tmp, path)
+    return _eikonals[key]
+
+
+@contextmanager
+def eikonalCache():
+    """Let gamma.utils.association use cachedEikonal within the block
+
+    GaMMA always solves config["eikonal"] itself and has no option to
+    pass a solved table, but association looks initialize_eikonal up in
+    gamma.utils on every call, so it is swapped only around the call.
+    """
+    initializeEikonal = gamma.utils.initialize_eikonal
+    gamma.utils.initialize_eikonal = cachedEikonal
+    try:
+        yield
+    finally:
+        gamma.utils.initialize_eikonal = initializeEikonal
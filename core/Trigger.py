@@ -0,0 +1,115 @@
+from numpy import ceil, floor, where, zeros
+from obspy import Stream
+from obspy.signal.trigger import classic_sta_lta, trigger_onset
+
+
+def stationTriggers(stream, config):
+    """Get STA/LTA trigger intervals of each station
+
+    The vertical component (or the first one) of each station is demeaned
+    and band-pass filtered on a copy before computing the ratio.
+
+    Returns:
+        dict: trigger (start, end) UTCDateTime intervals per station
+    """
+    triggers = {}
+    for tr in stream:
+        station = tr.stats.station
+        if tr.stats.channel[-1] != "Z" and \
+                len(stream.select(station=station, channel="??Z")):
+            continue
+        sr = tr.stats.sampling_rate
+        filtered = tr.copy()
+        filtered.detrend("demean")
+        filtered.filter("bandpass",
+                        freqmin=config["trigger_freqmin"],
+                        freqmax=min(config["trigger_freqmax"], 0.45 * sr))
+        ratio = classic_sta_lta(filtered.data,
+                                int(config["trigger_sta"] * sr),
+                                int(config["trigger_lta"] * sr))
+        for on, off in trigger_onset(
+                ratio, config["trigger_on"], config["trigger_off"]):
+            triggers.setdefault(station, []).append((
+                tr.stats.starttime + on / sr, tr.stats.starttime + off / sr))
+    return triggers
+
+
+def coincidenceWindows(triggers, starttime, endtime, config, minLength):
+    """Get time windows where enough stations trigger together
+
+    Args:
+        triggers (dict): trigger intervals per station
+        starttime (UTCDateTime): start of the data
+        endtime (UTCDateTime): end of the data
+        config (dict): a dictionary contains main configuration
+        minLength (float): shortest window the picker can use, in s
+
+    Returns:
+        list: merged (start, end) windows padded by trigger_margin
+    """
+    nBins = int(ceil(endtime - starttime)) + 1
+    active = zeros(nBins + 1, dtype=int)
+    for intervals in triggers.values():
+        stationActive = zeros(nBins + 1, dtype=int)
+        for on, off in intervals:
+            stationActive[int(floor(on - starttime)):int(ceil(off - starttime)) + 1] = 1
+        active += stationActive
+    margin = max(config["trigger_margin"], minLength / 2)
+    windows = []
+    for b in where(active >= config["trigger_coincidence"])[0]:
+        t1 = max(starttime, starttime + b - margin)
+        t2 = min(endtime, starttime + b + 1 + margin)
+        if windows and t1 <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], t2)
+        else:
+            windows.append([t1, t2])
+    return windows
+
+
+def networkWindows(streams, config, minLength):
+    """Get the coincidence windows of a day over all of its stations
+
+    Streams are used one at a time, so only the trigger intervals of the
+    whole network are kept in memory.
+
+    Args:
+        streams (iterable): obspy.Stream of one or more stations each
+        config (dict): a dictionary contains main configuration
+        minLength (float): shortest window the picker can use, in s
+
+    Returns:
+        list: merged (start, end) windows padded by trigger_margin
+    """
+    triggers, starttime, endtime = {}, None, None
+    for stream in streams:
+        if len(stream) == 0:
+            continue
+        for station, intervals in stationTriggers(stream, config).items():
+            triggers.setdefault(station, []).extend(intervals)
+        t1 = min([tr.stats.starttime for tr in stream])
+        t2 = max([tr.stats.endtime for tr in stream])
+        starttime = t1 if starttime is None else min(starttime, t1)
+        endtime = t2 if endtime is None else max(endtime, t2)
+    if starttime is None:
+        return []
+    return coincidenceWindows(triggers, starttime, endtime, config, minLength)
+
+
+def gateStream(stream, windows):
+    """Keep only the given coincidence windows of a stream
+
+    Args:
+        stream (obspy.Stream): continuous data
+        windows (list): (start, end) windows from networkWindows
+
+    Returns:
+        tuple: gated stream and the fraction of samples skipped
+    """
+    if len(stream) == 0:
+        return stream, 0.0
+    gated = Stream()
+    for t1, t2 in windows:
+        gated += stream.slice(t1, t2)
+    nTotal = sum([tr.stats.npts for tr in stream])
+    nKept = sum([tr.stats.npts for tr in gated])
+    return gated, 1 - nKept / nTotal if nTotal else 0.0
@@ -1,19 +1,23 @@
 import os
+from glob import glob
 from datetime import timedelta as td
 
 import proplot as plt
-from numpy import (abs, arange, array, histogram, max, mean, min, random, sqrt,
+from numpy import (abs, arange, array, histogram, max, mean, random, sqrt,
                    unique, nan)
 from obspy import Stream
 from obspy import UTCDateTime as utc
 from obspy import read, read_events
 from obspy.geodetics.base import degrees2kilometers as d2k
-from pandas import DataFrame, Series, date_range, read_csv
-from pyproj import Proj
+from pandas import DataFrame, date_range
 from tqdm import tqdm
 
 from core.Extra import handle_masked_arr, weighted_avg_and_std, weightMapper
 from core.PrepareData import prepareInventory
+from core.Projection import getProjection
+from core.Tables import readTable, toSeconds
+from core.ArrayArchive import readArchive
+from core.WaveformIndex import WaveformIndex
 from pathlib import Path
 
 
@@ -27,22 +31,14 @@ def plotSeismicity(config):
     endDateRange = date_range(startTime+td(days=1), endTime, freq="1D")
 
     if config["plotResults"]:
-        proj = Proj(f"+proj=sterea\
-                    +lon_0={config['center'][0]}\
-                    +lat_0={config['center'][1]}\
-                    +units=km")
+        proj = getProjection(config)
         for st, et in tqdm(
                 zip(startDateRange, endDateRange),
                 desc="+++ Plotting seismicity maps"):
             starttime = st.strftime('%Y-%m-%d')
             endtime = et.strftime('%Y-%m-%d')
-            catalog = os.path.join(
-                "results",
-                f"catalog_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.csv")
-            if not os.path.exists(catalog):
-                continue
-            catalog = read_csv(catalog, sep="\t")
-            if len(catalog) <= 1:
+            catalog = readTable("catalog", st, et, config)
+            if catalog is None or len(catalog) <= 1:
                 continue
             station_df, station_dict = prepareInventory(
                 config, proj, st, et, onsite=True)
@@ -96,39 +92,37 @@ def pickerTest(config):
     for st, et in tqdm(
             zip(startDateRange, endDateRange),
             desc="+++ Plotting picker test samples"):
-        starttime = st.strftime('%Y-%m-%d')
-        endtime = et.strftime('%Y-%m-%d')
-        catalog = os.path.join(
-            "results",
-            f"catalog_{starttime}_{endtime}.csv")
-        pick = os.path.join(
-            "results",
-            f"picks_{starttime}_{endtime}.csv")
-        proj = Proj(f"+proj=sterea\
-                    +lon_0={config['center'][0]}\
-                    +lat_0={config['center'][1]}\
-                    +units=km")
-
-        if not os.path.exists(catalog) and not os.path.exists(pick):
-            continue
+        proj = getProjection(config)
 
-        catalog_df = read_csv(catalog, sep="\t")
-        catalog_df.sort_values(by=["time"], inplace=True)
-        pick_df = read_csv(pick, sep="\t")
+        catalog_df = readTable("catalog", st, et, config)
+        pick_df = readTable("picks", st, et, config)
+        if catalog_df is None or pick_df is None:
+            continue
+        catalog_df["seconds"] = toSeconds(catalog_df["time"])
+        pick_df["seconds"] = toSeconds(pick_df["time"])
+        catalog_df.sort_values(by=["seconds"], inplace=True)
         station_df, station_dict = prepareInventory(config, proj, st, et)
 
+        index = None
+        if config["waveform_index"]:
+            index = WaveformIndex()
+            index.update(glob(os.path.join(
+                "DB",
+                f"{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}",
+                "waveforms",
+                "*.mseed")))
+
         for n in range(config["nTests"]):
 
             event_index = random.randint(len(catalog_df))
             event_picks = pick_df[pick_df["event_idx"] == event_index]
             event = catalog_df.iloc[event_index]
 
-            times = [utc(time) for time in event_picks.time]
-
-            if len(times) == 0:
+            if len(event_picks) == 0:
                 continue
 
-            first, last = min(times), max(times)
+            first = utc(event_picks["seconds"].min())
+            last = utc(event_picks["seconds"].max())
 
             sub = Stream()
 
@@ -140,7 +134,14 @@ def pickerTest(config):
                     "waveforms",
                     f"??.{station}.*.???__{st.strftime('%Y%m%d')}T000000Z__{et.strftime('%Y%m%d')}T000000Z.mseed")
                 try:
-                    stream = read(streamFile)
+                    if config["array_archive"]:
+                        stream = readArchive(
+                            station, st, et, first - 5, last + 5, channel="??Z")
+                    elif index:
+                        stream = index.read(
+                            station, first - 5, last + 5, channel="??Z")
+                    else:
+                        stream = read(streamFile)
                 except Exception:
                     continue
                 stream.merge(fill_value=None)
@@ -160,7 +161,7 @@ def pickerTest(config):
             ax = axs[0]
             [ax.grid(ls=":") for ax in axs]
             ax.format(
-                ultitle=f"Ort={utc(event['time']).strftime('%Y-%m-%dT%H:%M:%S')}, Lon={event['longitude']:0.3f}, Lat={event['latitude']:0.3f}, Dep={event['depth']:0.3f}, Mag={event['magnitude']:0.1f}",
+                ultitle=f"Ort={utc(event['seconds']).strftime('%Y-%m-%dT%H:%M:%S')}, Lon={event['longitude']:0.3f}, Lat={event['latitude']:0.3f}, Dep={event['depth']:0.3f}, Mag={event['magnitude']:0.1f}",
                 fontsize=4)
 
             for i, trace in enumerate(sub):
@@ -177,7 +178,7 @@ def pickerTest(config):
                 y = sqrt((station_x - event["x"]) ** 2 +
                          (station_y - event["y"]) ** 2 +
                          event["z"] ** 2)
-                x = utc(pick.time) - trace.stats.starttime
+                x = pick.seconds - trace.stats.starttime.timestamp
                 if pick.phase.upper() == "P":
                     ls = '-'
                 else:
@@ -194,6 +195,9 @@ def pickerTest(config):
                 path,
                 f"pickerTest_{n}_{st.strftime('%Y%m%d')}_{et.strftime('%Y%m%d')}.png"))
 
+        if index:
+            index.close()
+
 
 def pickerStats(config):
     path = Path(os.path.join("results", "figures"))
@@ -0,0 +1,281 @@
+import mmap
+import os
+import sqlite3
+from io import BytesIO
+from struct import unpack_from
+
+from obspy import Stream, read
+from obspy import UTCDateTime as utc
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime REAL,
+    size INTEGER);
+CREATE TABLE IF NOT EXISTS records (
+    file_id INTEGER,
+    network TEXT,
+    station TEXT,
+    location TEXT,
+    channel TEXT,
+    starttime REAL,
+    endtime REAL,
+    sampling_rate REAL,
+    offset INTEGER,
+    length INTEGER);
+CREATE TABLE IF NOT EXISTS gaps (
+    file_id INTEGER,
+    network TEXT,
+    station TEXT,
+    location TEXT,
+    channel TEXT,
+    starttime REAL,
+    endtime REAL);
+CREATE INDEX IF NOT EXISTS records_window
+    ON records (station, starttime, endtime);
+CREATE INDEX IF NOT EXISTS records_file ON records (file_id);
+CREATE INDEX IF NOT EXISTS gaps_window ON gaps (station, starttime, endtime);
+"""
+
+
+def samplingRate(factor, multiplier):
+    """Compute sampling rate from miniSEED rate factor and multiplier
+
+    Args:
+        factor (int): sample rate factor
+        multiplier (int): sample rate multiplier
+
+    Returns:
+        float: sampling rate in Hz
+    """
+    if factor == 0 or multiplier == 0:
+        return 0.0
+    if factor > 0 and multiplier > 0:
+        return float(factor * multiplier)
+    if factor > 0 and multiplier < 0:
+        return -factor / multiplier
+    if factor < 0 and multiplier > 0:
+        return -multiplier / factor
+    return 1.0 / (factor * multiplier)
+
+
+def parseRecordHeader(buf, offset):
+    """Parse the fixed header and blockettes 1000/1001 of a miniSEED record
+
+    Args:
+        buf (mmap.mmap): memory mapped miniSEED file
+        offset (int): byte offset of the record
+
+    Returns:
+        dict: record codes, start/end time (POSIX seconds), sampling rate
+        and record length in bytes
+    """
+    bo = ">"
+    year, jday = unpack_from(">HH", buf, offset + 20)
+    if not (1900 <= year <= 2100 and 1 <= jday <= 366):
+        bo = "<"
+    (year, jday, hour, minute, second, _, tenthMs,
+     nsamp, factor, multiplier) = unpack_from(f"{bo}HHBBBBHHhh", buf, offset + 20)
+    activity, _, _, nBlockettes, correction = unpack_from(
+        f"{bo}BBBBi", buf, offset + 36)
+    blockette = unpack_from(f"{bo}H", buf, offset + 46)[0]
+    reclen, micro = None, 0
+    for _ in range(nBlockettes):
+        if not blockette:
+            break
+        btype, bnext = unpack_from(f"{bo}HH", buf, offset + blockette)
+        if btype == 1000:
+            reclen = 2 ** unpack_from("B", buf, offset + blockette + 6)[0]
+        elif btype == 1001:
+            micro = unpack_from("b", buf, offset + blockette + 5)[0]
+        blockette = bnext
+    if reclen is None:
+        raise ValueError(f"record at byte {offset} has no blockette 1000")
+    starttime = utc(year=year, julday=jday, hour=hour, minute=minute,
+                    second=second).timestamp
+    starttime += tenthMs * 1e-4 + micro * 1e-6
+    if not activity & 0x02:
+        starttime += correction * 1e-4
+    rate = samplingRate(factor, multiplier)
+    endtime = starttime + (nsamp / rate if rate else 0.0)
+    return {
+        "network": buf[offset + 18:offset + 20].decode().strip(),
+        "station": buf[offset + 8:offset + 13].decode().strip(),
+        "location": buf[offset + 13:offset + 15].decode().strip(),
+        "channel": buf[offset + 15:offset + 18].decode().strip(),
+        "starttime": starttime,
+        "endtime": endtime,
+        "sampling_rate": rate,
+        "offset": offset,
+        "length": reclen,
+    }
+
+
+def scanRecords(path):
+    """Scan all record headers of a miniSEED file without decoding data
+
+    Args:
+        path (str): path to miniSEED file
+
+    Returns:
+        list: a list of record header dictionaries
+    """
+    records = []
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return records
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            offset = 0
+            while offset + 48 <= len(buf):
+                record = parseRecordHeader(buf, offset)
+                records.append(record)
+                offset += record["length"]
+    return records
+
+
+def findGaps(records):
+    """Find gaps between consecutive records of each channel
+
+    Args:
+        records (list): record header dictionaries of a file
+
+    Returns:
+        list: a list of (network, station, location, channel, start, end)
+    """
+    gaps, channels = [], {}
+    for record in records:
+        key = (record["network"], record["station"],
+               record["location"], record["channel"])
+        channels.setdefault(key, []).append(record)
+    for key, channelRecords in channels.items():
+        channelRecords = sorted(channelRecords, key=lambda r: r["starttime"])
+        for prev, curr in zip(channelRecords[:-1], channelRecords[1:]):
+            tolerance = 0.5 / prev["sampling_rate"] if prev["sampling_rate"] else 0
+            if curr["starttime"] - prev["endtime"] > tolerance:
+                gaps.append((*key, prev["endtime"], curr["starttime"]))
+    return gaps
+
+
+class WaveformIndex():
+    """A SQLite index of miniSEED record headers in DB/<day>/waveforms
+    """
+
+    def __init__(self, indexFile=os.path.join("DB", "waveforms.sqlite")):
+        self.indexFile = indexFile
+        self.con = sqlite3.connect(indexFile)
+        self.con.executescript(SCHEMA)
+
+    def close(self):
+        self.con.close()
+
+    def update(self, paths):
+        """Index new files and re-index files whose mtime or size changed
+
+        Args:
+            paths (list): miniSEED file paths
+
+        Returns:
+            int: number of (re-)indexed files
+        """
+        nIndexed = 0
+        for path in paths:
+            stat = os.stat(path)
+            row = self.con.execute(
+                "SELECT id, mtime, size FROM files WHERE path = ?",
+                (path,)).fetchone()
+            if row and row[1] == stat.st_mtime and row[2] == stat.st_size:
+                continue
+            try:
+                records = scanRecords(path)
+            except Exception as e:
+                print(f"+++ Could not index {path}: {e}")
+                continue
+            with self.con:
+                if row:
+                    self.con.execute("DELETE FROM records WHERE file_id = ?", (row[0],))
+                    self.con.execute("DELETE FROM gaps WHERE file_id = ?", (row[0],))
+                    self.con.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                fileId = self.con.execute(
+                    "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                    (path, stat.st_mtime, stat.st_size)).lastrowid
+                self.con.executemany(
+                    "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(fileId, r["network"], r["station"], r["location"],
+                      r["channel"], r["starttime"], r["endtime"],
+                      r["sampling_rate"], r["offset"], r["length"])
+                     for r in records])
+                self.con.executemany(
+                    "INSERT INTO gaps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(fileId, *gap) for gap in findGaps(records)])
+            nIndexed += 1
+        return nIndexed
+
+    def query(self, station, starttime, endtime, channel="*"):
+        """Return the records covering a time window
+
+        Args:
+            station (str): station code
+            starttime (UTCDateTime): window start
+            endtime (UTCDateTime): window end
+            channel (str, optional): channel code, glob wildcards allowed.
+            Defaults to "*".
+
+        Returns:
+            list: a list of (path, offset, length) tuples sorted by file
+            and offset
+        """
+        return self.con.execute(
+            "SELECT files.path, records.offset, records.length "
+            "FROM records JOIN files ON files.id = records.file_id "
+            "WHERE records.station = ? AND records.channel GLOB ? "
+            "AND records.endtime >= ? AND records.starttime <= ? "
+            "ORDER BY files.path, records.offset",
+            (station, channel, utc(starttime).timestamp,
+             utc(endtime).timestamp)).fetchall()
+
+    def gaps(self, station, starttime, endtime, channel="*"):
+        """Return the gaps of a station inside a time window
+
+        Returns:
+            list: a list of (network, station, location, channel, start, end)
+        """
+        return self.con.execute(
+            "SELECT network, station, location, channel, starttime, endtime "
+            "FROM gaps WHERE station = ? AND channel GLOB ? "
+            "AND endtime >= ? AND starttime <= ? ORDER BY starttime",
+            (station, channel, utc(starttime).timestamp,
+             utc(endtime).timestamp)).fetchall()
+
+    def read(self, station, starttime, endtime, channel="*"):
+        """Read only the records covering a time window
+
+        Args:
+            station (str): station code
+            starttime (UTCDateTime): window start
+            endtime (UTCDateTime): window end
+            channel (str, optional): channel code, glob wildcards allowed.
+            Defaults to "*".
+
+        Returns:
+            obspy.Stream: stream sliced to the requested window
+        """
+        records = self.query(station, starttime, endtime, channel)
+        # Merge adjacent records into contiguous byte ranges
+        ranges = []
+        for path, offset, length in records:
+            if ranges and ranges[-1][0] == path and \
+                    ranges[-1][1] + ranges[-1][2] == offset:
+                ranges[-1][2] += length
+            else:
+                ranges.append([path, offset, length])
+        buf = BytesIO()
+        for path, offset, length in ranges:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                buf.write(f.read(length))
+        if buf.tell() == 0:
+            return Stream()
+        buf.seek(0)
+        st = read(buf, format="MSEED", check_compression=False)
+        return st.slice(utc(starttime), utc(endtime))
@@ -7,6 +7,7 @@ from hypo71.Locate import locateHypo71
 from hypocenter.Locate import locateHypocenter
 from hypodd.Locate import locateHypoDD
 from core.Picker import runPicker
+from core.PickScheduler import runPickScheduler
 from core.Associator import runAssociator
 from core.Visualizer import pickerStats, pickerTest, plotSeismicity
 from core.CrossSection import plotCrossSection
@@ -23,7 +24,10 @@ class Main():
         fetchRawWaveforms(self.config)
 
     def Picker(self):
-        runPicker(self.config)
+        if self.config["picker_scheduler"]:
+            runPickScheduler(self.config)
+        else:
+            runPicker(self.config)
 
     def Associator(self):
         runAssociator(self.config)
@@ -0,0 +1,84 @@
+import pytest
+from pandas import DataFrame, Timedelta, Timestamp, to_datetime
+
+pytest.importorskip("gamma")
+pytest.importorskip("pyocto")
+
+from core import Associator  # noqa: E402
+from core.Tables import toSeconds  # noqa: E402
+
+ST, ET = Timestamp("2020-01-01"), Timestamp("2020-01-02")
+
+
+def dayPicks(nEvents):
+    """Three P picks per event, one event every hour"""
+    seconds = [ST.timestamp() + 3600 * (e + 1) + s + 0.25
+               for e in range(nEvents) for s in range(3)]
+    return DataFrame({
+        "trace_id": [f"XX.S{i % 3}." for i in range(len(seconds))],
+        "peak_time": seconds,
+        "time": to_datetime(seconds, unit="s"),
+        "peak_value": 0.9,
+        "phase": "P",
+        "amplitude": 1e-6,
+    })
+
+
+def fakeGamma(config, st, et, proj, picks):
+    """One event per hour of picks, GaMMA-like output types"""
+    hours = ((picks["peak_time"] - ST.timestamp()) // 3600).astype(int)
+    events = sorted(set(hours))
+    catalog = DataFrame({
+        "time": [(ST + Timedelta(seconds=3600 * h - 1)).isoformat()
+                 for h in events],
+        "magnitude": float("nan"),
+        "longitude": 0.0,
+        "latitude": 0.0,
+        "depth": 10.0,
+        "sigma_time": 0.1,
+        "sigma_amp": 0.0,
+        "cov_time_amp": 0.0,
+        "event_index": range(len(events)),
+        "gamma_score": 1.0})
+    assigned = DataFrame({
+        "station": picks["trace_id"],
+        "time": picks["time"],
+        "phase": picks["phase"].str.lower(),
+        "probability": picks["peak_value"],
+        "phase_amp": picks["amplitude"],
+        "amplitude": picks["amplitude"],
+        "event_idx": hours.map(dict(zip(events, range(len(events))))),
+        "gamma_score": 1.0})
+    return catalog, assigned
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_repeated_incremental_runs(tmp_path, monkeypatch, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "results").mkdir()
+    monkeypatch.setattr(Associator, "getProjection", lambda config: None)
+    monkeypatch.setattr(Associator, "assocciateWithGamma", fakeGamma)
+    config = {
+        "associator": "GaMMA",
+        "association_incremental": True,
+        "association_reopen": False,
+        "association_tail_margin": 10,
+        "time_before": 10,
+        "table_format": fmt,
+        "table_csv_export": False,
+    }
+    for nEvents in [1, 2, 3, 4]:
+        monkeypatch.setattr(Associator, "dayPicks",
+                            lambda config, st, et, n=nEvents: dayPicks(n))
+        assert Associator.associateDay(config, ST, ET)
+    catalog, picks = Associator.readAssociation(ST, ET, config)
+    assert sorted(catalog["event_index"]) == [0, 1, 2, 3]
+    assert len(picks) == 12
+    assert toSeconds(picks["time"]).notna().all()
+    if fmt == "csv":
+        # Committed and new rows are written in the same ISO format
+        assert picks["time"].str.contains("T").all()
+        assert catalog["time"].str.contains("T").all()
+    assert toSeconds(catalog["time"]).is_monotonic_increasing